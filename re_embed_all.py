@@ -3,42 +3,133 @@
 Re-embed all existing chunks from the database
 """
 import asyncio
+import hashlib
 import os
+import sqlite3
 import sys
 import json
-import requests
+import httpx
+import numpy as np
 from typing import List, Dict, Any
 
 # Add the server directory to path so we can import our agents
 sys.path.append(os.path.join(os.path.dirname(__file__), 'server'))
 
-async def get_all_videos_with_chunks():
+from agents.vector_embedder import VectorEmbedder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Maximum number of chunk fetches in flight against the Node.js API
+FETCH_CONCURRENCY = 12
+
+# Maximum number of videos (or embedding batches) being embedded at the same time
+EMBED_CONCURRENCY = 6
+
+# Upper bounds for a single embedding request: number of texts and estimated tokens
+EMBED_BATCH_SIZE = 512
+EMBED_BATCH_TOKENS = 250_000
+
+# On-disk cache of previously computed chunk embeddings
+EMBED_CACHE_PATH = os.getenv(
+    'EMBED_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server', 'data', 'embedding_cache.sqlite')
+)
+
+class EmbeddingCache:
+    """Content-addressed SQLite cache of embedding vectors keyed by sha256(model|content)"""
+    
+    def __init__(self, path: str, model: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.model = model
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB)')
+    
+    def key(self, content: str) -> str:
+        return hashlib.sha256(f"{self.model}|{content}".encode('utf-8')).hexdigest()
+    
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the given texts, keyed by text"""
+        by_key = {self.key(text): text for text in texts}
+        keys = list(by_key)
+        found = {}
+        
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            placeholders = ','.join('?' * len(part))
+            rows = self.conn.execute(f'SELECT key, vec FROM embeddings WHERE key IN ({placeholders})', part)
+            for key, vec in rows:
+                found[by_key[key]] = np.frombuffer(vec, dtype=np.float32)
+        
+        return found
+    
+    def put_many(self, vectors: Dict[str, np.ndarray]):
+        """Store vectors keyed by their source text"""
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)',
+            [(self.key(text), np.asarray(vec, dtype=np.float32).tobytes()) for text, vec in vectors.items()]
+        )
+        self.conn.commit()
+    
+    def close(self):
+        self.conn.close()
+
+def decode_json(data: bytes) -> Any:
+    """Decode a JSON response body, using orjson when it is installed"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+async def fetch_json(session: httpx.AsyncClient, method: str, url: str, **kw) -> Any:
+    """Issue a request on the shared session and decode the JSON body"""
+    response = await session.request(method, url, **kw)
+    if response.status_code != 200:
+        raise Exception(f"{method} {url} failed: {response.status_code}")
+    return decode_json(response.content)
+
+async def fetch_chunks(session: httpx.AsyncClient, sem: asyncio.Semaphore, video: Dict[str, Any]):
+    """Fetch the chunks for one video, returning (video, chunks) or None"""
+    async with sem:
+        chunks_response = await session.get(f"http://localhost:3000/api/videos/{video['id']}/chunks")
+    
+    if chunks_response.status_code != 200:
+        print(f"No chunks found for video {video['youtubeId']}")
+        return None
+    
+    chunks = decode_json(chunks_response.content)
+    if not chunks:
+        return None
+    
+    print(f"Video {video['youtubeId']}: {len(chunks)} chunks")
+    return video, chunks
+
+async def get_all_videos_with_chunks(session: httpx.AsyncClient):
     """Get all videos and their chunks from the Node.js API"""
     try:
         # Get all videos
-        response = requests.get('http://localhost:3000/api/videos')
-        if response.status_code != 200:
-            raise Exception(f"Failed to get videos: {response.status_code}")
-        
-        videos = response.json()
+        videos = await fetch_json(session, 'GET', 'http://localhost:3000/api/videos')
         print(f"Found {len(videos)} videos")
         
-        videos_with_chunks = []
+        # Fetch chunks for all indexed videos concurrently, bounded by FETCH_CONCURRENCY
+        sem = asyncio.Semaphore(FETCH_CONCURRENCY)
+        tasks = [
+            fetch_chunks(session, sem, video)
+            for video in videos
+            if video.get('status') == 'indexed' and video.get('chunkCount', 0) > 0
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
         
-        for video in videos:
-            if video.get('status') == 'indexed' and video.get('chunkCount', 0) > 0:
-                # Get chunks for this video
-                chunks_response = requests.get(f"http://localhost:3000/api/videos/{video['id']}/chunks")
-                if chunks_response.status_code == 200:
-                    chunks = chunks_response.json()
-                    if chunks:
-                        videos_with_chunks.append({
-                            'video': video,
-                            'chunks': chunks
-                        })
-                        print(f"Video {video['youtubeId']}: {len(chunks)} chunks")
-                else:
-                    print(f"No chunks found for video {video['youtubeId']}")
+        videos_with_chunks = []
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Error getting chunks: {result}")
+            elif result:
+                video, chunks = result
+                videos_with_chunks.append({
+                    'video': video,
+                    'chunks': chunks
+                })
         
         return videos_with_chunks
     
@@ -46,12 +137,68 @@ async def get_all_videos_with_chunks():
         print(f"Error getting videos: {e}")
         return []
 
-async def embed_video_chunks(video_data: Dict[str, Any]):
+def flatten_chunks(videos_with_chunks: List[Dict[str, Any]]) -> List[str]:
+    """Collect the unique chunk texts across all videos, in first-seen order"""
+    return list(dict.fromkeys(
+        chunk['content'] for video_data in videos_with_chunks for chunk in video_data['chunks']
+    ))
+
+def make_batches(texts: List[str]) -> List[List[str]]:
+    """Split texts into batches bounded by EMBED_BATCH_SIZE and EMBED_BATCH_TOKENS"""
+    batches = []
+    batch = []
+    batch_tokens = 0
+    
+    for text in texts:
+        estimate = len(text) // 4 + 1  # ~4 characters per token
+        if batch and (len(batch) >= EMBED_BATCH_SIZE or batch_tokens + estimate > EMBED_BATCH_TOKENS):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += estimate
+    
+    if batch:
+        batches.append(batch)
+    
+    return batches
+
+async def embed_all_chunks(embedder: VectorEmbedder, cache: EmbeddingCache, videos_with_chunks: List[Dict[str, Any]]):
+    """Embed every chunk across all videos in batched requests.
+    
+    Chunks found in the on-disk cache are not sent to the API. All vectors land
+    in the embedder's content-keyed cache, so the per-video create_embeddings
+    tasks that follow are served without further API calls.
+    """
+    texts = flatten_chunks(videos_with_chunks)
+    hits = cache.get_many(texts)
+    # Make room for every chunk so none is evicted before its create_embeddings task runs
+    embedder.embeddings_cache_size = max(embedder.embeddings_cache_size, len(texts))
+    embedder.cache_embeddings(hits)
+    print(f"💾 {len(hits)} of {len(texts)} unique chunks found in embedding cache")
+    
+    batches = make_batches([text for text in texts if text not in hits])
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+    
+    async def run(batch: List[str]):
+        async with sem:
+            return await embedder.process_task({'type': 'create_embeddings_batch', 'chunks': batch})
+    
+    results = await asyncio.gather(*(run(b) for b in batches), return_exceptions=True)
+    
+    new_vectors = {}
+    for batch, r in zip(batches, results):
+        if isinstance(r, Exception):
+            print(f"❌ Embedding batch failed: {r}")
+        else:
+            new_vectors.update(zip(batch, r['embeddings']))
+    
+    cache.put_many(new_vectors)
+    print(f"🧮 Embedded {len(new_vectors)} unique chunks in {len(batches)} batched requests")
+
+async def embed_video_chunks(embedder: VectorEmbedder, video_data: Dict[str, Any]):
     """Embed chunks for a single video using Python agents"""
     try:
-        from agents.vector_embedder import VectorEmbedder
-        
-        embedder = VectorEmbedder()
         video = video_data['video']
         chunks = video_data['chunks']
         
@@ -87,64 +234,75 @@ async def main():
     """Re-embed all chunks"""
     print("🚀 Starting re-embedding process...")
     
-    # Check if services are running
-    try:
-        response = requests.get('http://localhost:3000/api/videos')
-        if response.status_code != 200:
-            print("❌ Node.js server not running on port 3000")
+    # One pooled client for the whole run so every request reuses keep-alive connections
+    limits = httpx.Limits(max_connections=32, keepalive_expiry=60)
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as session:
+        # Check if services are running
+        try:
+            response = await session.get('http://localhost:3000/api/videos')
+            if response.status_code != 200:
+                print("❌ Node.js server not running on port 3000")
+                return
+        except httpx.HTTPError:
+            print("❌ Cannot connect to Node.js server on port 3000")
             return
-    except:
-        print("❌ Cannot connect to Node.js server on port 3000")
-        return
-    
-    try:
-        response = requests.post('http://localhost:8000/search-transcripts', 
-                               json={'query': 'test', 'top_k': 1})
-        if response.status_code != 200:
-            print("❌ Python agent server not running on port 8000")
+        
+        try:
+            response = await session.get('http://localhost:8000/health', timeout=2.0)
+            if response.status_code != 200:
+                print("❌ Python agent server not running on port 8000")
+                return
+        except httpx.HTTPError:
+            print("❌ Cannot connect to Python agent server on port 8000")
             return
-    except:
-        print("❌ Cannot connect to Python agent server on port 8000")
-        return
-    
-    print("✅ Both servers are running")
-    
-    # Get all videos with chunks
-    videos_with_chunks = await get_all_videos_with_chunks()
-    
-    if not videos_with_chunks:
-        print("❌ No videos with chunks found")
-        return
-    
-    print(f"🔄 Processing {len(videos_with_chunks)} videos...")
-    
-    # Process each video
-    successful = 0
-    failed = 0
-    
-    for video_data in videos_with_chunks:
-        result = await embed_video_chunks(video_data)
-        if result:
-            successful += 1
-        else:
-            failed += 1
-    
-    print(f"\n📊 Re-embedding complete!")
-    print(f"✅ Successfully embedded: {successful} videos")
-    print(f"❌ Failed: {failed} videos")
-    
-    # Test the search
-    print("\n🔍 Testing search...")
-    try:
-        test_response = requests.post('http://localhost:8000/search-transcripts', 
-                                    json={'query': 'machine learning', 'top_k': 3})
-        if test_response.status_code == 200:
-            result = test_response.json()
-            print(f"✅ Search test successful: {result['data']['total_results']} results found")
+        
+        print("✅ Both servers are running")
+        
+        # Get all videos with chunks
+        videos_with_chunks = await get_all_videos_with_chunks(session)
+        
+        if not videos_with_chunks:
+            print("❌ No videos with chunks found")
+            return
+        
+        print(f"🔄 Processing {len(videos_with_chunks)} videos...")
+        
+        embedder = VectorEmbedder()
+        
+        # Embed all chunks up front in large batched requests, skipping cached ones
+        cache = EmbeddingCache(EMBED_CACHE_PATH, embedder.embedding_model)
+        try:
+            await embed_all_chunks(embedder, cache, videos_with_chunks)
+        finally:
+            cache.close()
+        
+        # Process videos concurrently, bounded by EMBED_CONCURRENCY
+        sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+        
+        async def run(video_data: Dict[str, Any]):
+            async with sem:
+                return await embed_video_chunks(embedder, video_data)
+        
+        # The search self-test goes to the agent server and does not depend on the
+        # local embedding work, so it runs alongside the per-video tasks
+        search_test = fetch_json(session, 'POST', 'http://localhost:8000/search-transcripts', 
+                                 json={'query': 'machine learning', 'top_k': 3})
+        *results, search_result = await asyncio.gather(
+            *(run(v) for v in videos_with_chunks), search_test, return_exceptions=True
+        )
+        successful = sum(1 for r in results if r and not isinstance(r, Exception))
+        failed = len(results) - successful
+        
+        print(f"\n📊 Re-embedding complete!")
+        print(f"✅ Successfully embedded: {successful} videos")
+        print(f"❌ Failed: {failed} videos")
+        
+        # Report the search test
+        print("\n🔍 Testing search...")
+        if isinstance(search_result, Exception):
+            print(f"❌ Search test failed: {search_result}")
         else:
-            print(f"❌ Search test failed: {test_response.status_code}")
-    except Exception as e:
-        print(f"❌ Search test error: {e}")
+            print(f"✅ Search test successful: {search_result['data']['total_results']} results found")
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -1,23 +1,38 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Any, Dict, List
 import logging
 import time
-from datetime import datetime
 
-logging.basicConfig(level=logging.INFO)
+# The formatter supplies the timestamp for every agent log line
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(asctime)s] %(levelname)s:%(name)s:%(message)s",
+    datefmt="%H:%M:%S"
+)
 logger = logging.getLogger(__name__)
 
+LOG_LEVELS = {
+    "error": logging.ERROR,
+    "warning": logging.WARNING,
+    "info": logging.INFO
+}
+
 class BaseAgent(ABC):
     """Base class for all agents in the multi-agent system"""
     
-    def __init__(self, name: str, description: str):
+    def __init__(self, name: str, description: str, max_queue: int = 1000):
         self.name = name
+        self._upper_name = name.upper()
         self.description = description
         self.status = "inactive"
-        self.queue = []
+        self.max_queue = max_queue
+        self.queue = asyncio.Queue(maxsize=max_queue)
         self.total_tasks = 0
         self.successful_tasks = 0
+        self._success_rate = 0.0
         self.start_time = time.time()
+        self._started_monotonic = time.monotonic()
         self.last_action = None
         
     @abstractmethod
@@ -26,58 +41,54 @@ class BaseAgent(ABC):
         pass
     
     async def add_task(self, task: Dict[str, Any]):
-        """Add a task to the agent's queue"""
-        self.queue.append(task)
-        logger.info(f"[{self.name}] Task added to queue. Queue size: {len(self.queue)}")
+        """Add a task to the agent's queue, waiting for room when it is full"""
+        await self.queue.put(task)
+        logger.info("[%s] Task added to queue. Queue size: %d", self.name, self.queue.qsize())
     
     async def execute_next_task(self) -> Dict[str, Any]:
         """Execute the next task in the queue"""
-        if not self.queue:
+        if self.queue.empty():
             return {"status": "no_tasks", "message": "No tasks in queue"}
         
         self.status = "busy"
-        task = self.queue.pop(0)
+        task = self.queue.get_nowait()
         self.total_tasks += 1
         
         try:
-            logger.info(f"[{self.name}] Processing task: {task.get('type', 'unknown')}")
+            logger.info("[%s] Processing task: %s", self.name, task.get('type', 'unknown'))
             result = await self.process_task(task)
             self.successful_tasks += 1
             self.last_action = f"Completed {task.get('type', 'task')}"
             self.status = "active"
             
-            logger.info(f"[{self.name}] Task completed successfully")
+            logger.info("[%s] Task completed successfully", self.name)
             return {"status": "success", "result": result}
             
         except Exception as e:
-            logger.error(f"[{self.name}] Task failed: {str(e)}")
+            logger.error("[%s] Task failed: %s", self.name, e)
             self.status = "active"
             return {"status": "error", "error": str(e)}
+        
+        finally:
+            self._success_rate = self.successful_tasks * 100.0 / self.total_tasks
+            self.queue.task_done()
     
     def get_status(self) -> Dict[str, Any]:
         """Get current agent status"""
-        uptime_minutes = int((time.time() - self.start_time) / 60)
+        uptime_minutes = int((time.monotonic() - self._started_monotonic) / 60)
         
         return {
             "name": self.name,
             "description": self.description,
             "status": self.status,
-            "queue_count": len(self.queue),
+            "queue_count": self.queue.qsize(),
             "uptime": uptime_minutes,
             "total_tasks": self.total_tasks,
             "successful_tasks": self.successful_tasks,
             "last_action": self.last_action,
-            "success_rate": (self.successful_tasks / max(1, self.total_tasks)) * 100
+            "success_rate": self._success_rate
         }
     
     def log_action(self, message: str, level: str = "info"):
-        """Log an action with timestamp"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        formatted_message = f"[{timestamp}] [{self.name.upper()}] {message}"
-        
-        if level == "error":
-            logger.error(formatted_message)
-        elif level == "warning":
-            logger.warning(formatted_message)
-        else:
-            logger.info(formatted_message)
+        """Log an action; the timestamp is added by the log formatter"""
+        logger.log(LOG_LEVELS.get(level, logging.INFO), "[%s] %s", self._upper_name, message)
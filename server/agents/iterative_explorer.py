@@ -1,10 +1,164 @@
 import os
 import asyncio
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Union
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
 from .base_agent import BaseAgent
+from .llm_cache import cached_chat
 import json
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class Insight(BaseModel):
+    """Expected shape of the insight-extraction response"""
+    
+    model_config = ConfigDict(extra='allow')
+    
+    concepts: List[str] = []
+    related_topics: List[str] = []
+    novel_info: Union[str, List[str]] = ''
+    connections: Union[str, List[str]] = ''
+
+_QUERY_LIST = TypeAdapter(List[str])
+
+def _strip_code_fence(text: str) -> str:
+    """Remove a ```json ... ``` wrapper that chat models often put around JSON"""
+    
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[1] if '\n' in text else ''
+        text = text.rsplit('```', 1)[0]
+    return text
+
+def _parse_insight(text: str) -> Dict[str, Any]:
+    """Decode and validate an insight response in one pass, loosely re-parsing what fails"""
+    
+    text = _strip_code_fence(text)
+    try:
+        return Insight.model_validate_json(text).model_dump()
+    except ValidationError:
+        return _loads(text)
+
+def _parse_queries(text: str) -> List[str]:
+    """Decode and validate a JSON array of query strings"""
+    
+    text = _strip_code_fence(text)
+    try:
+        return _QUERY_LIST.validate_json(text)
+    except ValidationError:
+        return [str(q) for q in _loads(text)]
+
+def _loads(text: str) -> Any:
+    """Parse LLM JSON output with orjson, falling back to json for what it rejects"""
+    
+    text = _strip_code_fence(text)
+    if orjson:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+def _dumps_indented(obj: Any) -> str:
+    """Serialize obj as 2-space indented JSON for embedding in a prompt"""
+    
+    if orjson:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+        except TypeError:
+            pass
+    return json.dumps(obj, indent=2)
+
+# Prompt templates, filled with str.format_map
+_EXTRACT_INSIGHTS_TMPL = """
+            Given this transcript snippet and learning goal, extract key insights:
+            
+            Learning Goal: {learning_goal}
+            
+            Transcript: {text}
+            
+            Extract:
+            1. Key concepts mentioned
+            2. Related topics to explore
+            3. Surprising or novel information
+            4. Connections to the learning goal
+            
+            Format as JSON with keys: concepts, related_topics, novel_info, connections
+            """
+
+_FOLLOW_UP_QUERIES_TMPL = """
+            Based on these discovered concepts and the learning goal, generate follow-up search queries:
+            
+            Learning Goal: {learning_goal}
+            
+            Discovered Concepts: {concepts}
+            Related Topics: {topics}
+            Previous Queries: {previous_queries}
+            
+            Generate 3 follow-up queries that:
+            1. Explore deeper into promising concepts
+            2. Bridge gaps in understanding
+            3. Find practical applications or examples
+            
+            Avoid repeating previous queries. Return as JSON array.
+            """
+
+_SYNTHESIZE_TMPL = """
+            Synthesize the exploration results for this learning goal:
+            
+            Learning Goal: {learning_goal}
+            
+            Queries Used: {queries}
+            Videos Explored: {videos_explored}
+            Key Insights: {insights}
+            
+            Provide:
+            1. A coherent learning path summary
+            2. Key takeaways
+            3. Suggested next steps
+            4. Gaps that still need exploration
+            
+            Format as JSON with keys: summary, key_takeaways, next_steps, gaps
+            """
+
+_ALTERNATIVE_QUERY_TMPL = """
+            The search query "{original_query}" returned no results.
+            Learning goal: {learning_goal}
+            
+            Generate an alternative search query that:
+            1. Uses simpler or more common terms
+            2. Focuses on fundamental concepts
+            3. Might find introductory content
+            
+            Return only the query text.
+            """
+
+_REFINE_SEARCH_TMPL = """
+            Refine this search query based on context and previous results:
+            
+            Original Query: {query}
+            Context: {context}
+            Previous Results: {previous_results}
+            
+            Suggest:
+            1. A refined query that better captures intent
+            2. Alternative search strategies
+            3. Filters or constraints to apply
+            
+            Format as JSON with keys: refined_query, strategy, filters
+            """
+
+def build_alternative_query_prompt(original_query: str, learning_goal: str) -> str:
+    """Build the prompt used to rephrase a query that returned no results"""
+    
+    return _ALTERNATIVE_QUERY_TMPL.format_map({
+        'original_query': original_query,
+        'learning_goal': learning_goal
+    })
+
 class IterativeExplorerAgent(BaseAgent):
     """Agent that performs iterative exploration of video transcripts with query refinement"""
     
@@ -17,6 +171,9 @@ class IterativeExplorerAgent(BaseAgent):
         self.max_iterations = 5
         self.exploration_depth = 3
         self.similarity_threshold = 0.7
+        # Cap on concurrent insight-extraction calls per hop
+        self.max_parallel_llm = 3
+        self._llm_sem = asyncio.Semaphore(self.max_parallel_llm)
         
     async def process_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Process an iterative exploration task"""
@@ -51,32 +208,48 @@ class IterativeExplorerAgent(BaseAgent):
         }
         
         current_query = initial_query
+        # Mirrors exploration_graph['queries'] for constant-time loop checks
+        seen_queries = {initial_query}
         visited_videos = set()
         iteration = 0
+        # Search for the next hop's query, started before the current hop finishes
+        next_search: Optional[asyncio.Task] = None
         
         while iteration < max_hops:
             self.log_action(f"Iteration {iteration + 1}: Exploring '{current_query}'")
             
             # Search for relevant content
-            search_results = await self._search_transcripts(current_query)
+            if next_search is not None:
+                search_results = await next_search
+                next_search = None
+            else:
+                search_results = await self._search_transcripts(current_query)
             
             if not search_results:
                 self.log_action("No results found, generating alternative query")
                 current_query = await self._generate_alternative_query(current_query, learning_goal)
-                if current_query in exploration_graph['queries']:
+                if current_query in seen_queries:
                     break  # Avoid loops
+                seen_queries.add(current_query)
                 exploration_graph['queries'].append(current_query)
                 continue
             
-            # Process results and extract insights
+            # Partition the top 3 results up front, keeping the first hit per unseen video
+            fresh = {}
+            for r in search_results[:3]:
+                if r.get('video_id') not in visited_videos:
+                    fresh.setdefault(r.get('video_id'), r)
+            visited_videos.update(fresh)
+            
+            # Extract insights for the fresh results concurrently
+            extracted = await asyncio.gather(
+                *(self._extract_insights_limited(r, learning_goal) for r in fresh.values()),
+                return_exceptions=True
+            )
+            
+            # Process results in rank order
             new_insights = []
-            for result in search_results[:3]:  # Top 3 results
-                video_id = result.get('video_id')
-                if video_id in visited_videos:
-                    continue
-                    
-                visited_videos.add(video_id)
-                
+            for (video_id, result), insights in zip(fresh.items(), extracted):
                 # Add to exploration graph
                 node = {
                     'id': f"video_{video_id}",
@@ -87,8 +260,9 @@ class IterativeExplorerAgent(BaseAgent):
                 }
                 exploration_graph['nodes'].append(node)
                 
-                # Extract key concepts and insights
-                insights = await self._extract_insights(result, learning_goal)
+                # Add the extracted concepts and insights
+                if isinstance(insights, Exception):
+                    insights = []
                 new_insights.extend(insights)
                 exploration_graph['insights'].extend(insights)
                 
@@ -110,8 +284,13 @@ class IterativeExplorerAgent(BaseAgent):
             if not follow_up_queries:
                 break
                 
-            # Select most promising follow-up query
-            current_query = follow_up_queries[0]
+            # Select the most promising follow-up query that hasn't been explored yet
+            current_query = next((q for q in follow_up_queries if q not in seen_queries), None)
+            if current_query is None:
+                break
+            if iteration + 1 < max_hops:
+                next_search = asyncio.create_task(self._search_transcripts(current_query))
+            seen_queries.add(current_query)
             exploration_graph['queries'].append(current_query)
             
             iteration += 1
@@ -135,41 +314,27 @@ class IterativeExplorerAgent(BaseAgent):
         # For now, returning empty list as search index is empty
         return []
     
+    async def _extract_insights_limited(self, search_result: Dict[str, Any], learning_goal: str) -> List[Dict[str, Any]]:
+        """Extract insights while respecting the max_parallel_llm cap"""
+        
+        async with self._llm_sem:
+            return await self._extract_insights(search_result, learning_goal)
+    
     async def _extract_insights(self, search_result: Dict[str, Any], learning_goal: str) -> List[Dict[str, Any]]:
         """Extract key insights from a search result"""
         
         try:
-            import openai
-            
             if not self.openai_api_key:
                 return []
             
-            openai.api_key = self.openai_api_key
-            
-            prompt = f"""
-            Given this transcript snippet and learning goal, extract key insights:
-            
-            Learning Goal: {learning_goal}
-            
-            Transcript: {search_result.get('text', '')[:1000]}
-            
-            Extract:
-            1. Key concepts mentioned
-            2. Related topics to explore
-            3. Surprising or novel information
-            4. Connections to the learning goal
-            
-            Format as JSON with keys: concepts, related_topics, novel_info, connections
-            """
+            prompt = _EXTRACT_INSIGHTS_TMPL.format_map({
+                'learning_goal': learning_goal,
+                'text': search_result.get('text', '')[:1000]
+            })
             
-            response = await asyncio.to_thread(
-                openai.ChatCompletion.create,
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
-            )
+            content = await cached_chat(prompt, model="gpt-3.5-turbo", temperature=0.7)
             
-            insights_data = json.loads(response.choices[0].message.content)
+            insights_data = _parse_insight(content)
             
             return [{
                 'video_id': search_result.get('video_id'),
@@ -185,45 +350,23 @@ class IterativeExplorerAgent(BaseAgent):
         """Generate intelligent follow-up queries based on insights"""
         
         try:
-            import openai
-            
             if not self.openai_api_key or not insights:
                 return []
             
-            openai.api_key = self.openai_api_key
-            
-            # Aggregate concepts and topics from insights
-            all_concepts = []
-            all_topics = []
-            for insight in insights:
-                all_concepts.extend(insight.get('concepts', []))
-                all_topics.extend(insight.get('related_topics', []))
+            # Aggregate unique concepts and topics from insights, keeping first-seen order
+            all_concepts = list(dict.fromkeys(c for i in insights for c in i.get('concepts', [])))
+            all_topics = list(dict.fromkeys(t for i in insights for t in i.get('related_topics', [])))
             
-            prompt = f"""
-            Based on these discovered concepts and the learning goal, generate follow-up search queries:
-            
-            Learning Goal: {learning_goal}
+            prompt = _FOLLOW_UP_QUERIES_TMPL.format_map({
+                'learning_goal': learning_goal,
+                'concepts': ', '.join(all_concepts[:10]),
+                'topics': ', '.join(all_topics[:10]),
+                'previous_queries': ', '.join(previous_queries)
+            })
             
-            Discovered Concepts: {', '.join(all_concepts[:10])}
-            Related Topics: {', '.join(all_topics[:10])}
-            Previous Queries: {', '.join(previous_queries)}
-            
-            Generate 3 follow-up queries that:
-            1. Explore deeper into promising concepts
-            2. Bridge gaps in understanding
-            3. Find practical applications or examples
+            content = await cached_chat(prompt, model="gpt-3.5-turbo", temperature=0.8)
             
-            Avoid repeating previous queries. Return as JSON array.
-            """
-            
-            response = await asyncio.to_thread(
-                openai.ChatCompletion.create,
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.8
-            )
-            
-            queries = json.loads(response.choices[0].message.content)
+            queries = _parse_queries(content)
             return queries[:3]  # Top 3 queries
             
         except Exception as e:
@@ -234,33 +377,19 @@ class IterativeExplorerAgent(BaseAgent):
         """Generate alternative query when no results found"""
         
         try:
-            import openai
-            
             if not self.openai_api_key:
                 return original_query + " tutorial"  # Simple fallback
             
-            openai.api_key = self.openai_api_key
+            prompt = build_alternative_query_prompt(original_query, learning_goal)
             
-            prompt = f"""
-            The search query "{original_query}" returned no results.
-            Learning goal: {learning_goal}
-            
-            Generate an alternative search query that:
-            1. Uses simpler or more common terms
-            2. Focuses on fundamental concepts
-            3. Might find introductory content
-            
-            Return only the query text.
-            """
-            
-            response = await asyncio.to_thread(
-                openai.ChatCompletion.create,
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
+            # Only this prompt's short slots are compared semantically; the others carry
+            # transcript text or hop state and are cached on exact matches only
+            content = await cached_chat(
+                prompt, model="gpt-3.5-turbo", temperature=0.7,
+                semantic_key=f"{original_query}\n{learning_goal}"
             )
             
-            return response.choices[0].message.content.strip()
+            return content.strip()
             
         except Exception as e:
             self.log_action(f"Failed to generate alternative query: {e}", "error")
@@ -270,8 +399,6 @@ class IterativeExplorerAgent(BaseAgent):
         """Synthesize findings from the exploration"""
         
         try:
-            import openai
-            
             if not self.openai_api_key:
                 return {
                     'summary': 'Exploration completed',
@@ -279,34 +406,16 @@ class IterativeExplorerAgent(BaseAgent):
                     'recommended_path': exploration_graph['queries']
                 }
             
-            openai.api_key = self.openai_api_key
+            prompt = _SYNTHESIZE_TMPL.format_map({
+                'learning_goal': learning_goal,
+                'queries': ', '.join(exploration_graph['queries']),
+                'videos_explored': len(exploration_graph['nodes']),
+                'insights': _dumps_indented([self._compact_insight(i) for i in exploration_graph['insights'][:10]])
+            })
             
-            prompt = f"""
-            Synthesize the exploration results for this learning goal:
-            
-            Learning Goal: {learning_goal}
-            
-            Queries Used: {', '.join(exploration_graph['queries'])}
-            Videos Explored: {len(exploration_graph['nodes'])}
-            Key Insights: {json.dumps(exploration_graph['insights'][:10], indent=2)}
-            
-            Provide:
-            1. A coherent learning path summary
-            2. Key takeaways
-            3. Suggested next steps
-            4. Gaps that still need exploration
-            
-            Format as JSON with keys: summary, key_takeaways, next_steps, gaps
-            """
+            content = await cached_chat(prompt, model="gpt-3.5-turbo", temperature=0.7)
             
-            response = await asyncio.to_thread(
-                openai.ChatCompletion.create,
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
-            )
-            
-            synthesis = json.loads(response.choices[0].message.content)
+            synthesis = _loads(content)
             synthesis['exploration_graph_summary'] = {
                 'total_queries': len(exploration_graph['queries']),
                 'total_videos': len(exploration_graph['nodes']),
@@ -323,48 +432,41 @@ class IterativeExplorerAgent(BaseAgent):
                 'recommended_path': exploration_graph['queries']
             }
     
+    def _compact_insight(self, insight: Dict[str, Any]) -> Dict[str, Any]:
+        """Trim an insight to the fields and lengths worth spending prompt tokens on"""
+        
+        compact = {
+            'concepts': insight.get('concepts', [])[:5],
+            'related_topics': insight.get('related_topics', [])[:5],
+            'novel_info': insight.get('novel_info', '')[:200],
+            'connections': insight.get('connections', '')[:200]
+        }
+        return {key: value for key, value in compact.items() if value}
+    
     async def _refine_search(self, query: str, previous_results: List[Dict], context: str) -> Dict[str, Any]:
         """Refine search based on previous results and context"""
         
         try:
-            import openai
-            
             if not self.openai_api_key:
                 return {'refined_query': query, 'strategy': 'no_refinement'}
             
-            openai.api_key = self.openai_api_key
-            
             # Analyze why previous results might not be satisfactory
             result_summary = []
             for r in previous_results[:5]:
                 result_summary.append({
-                    'title': r.get('title', ''),
+                    'title': r.get('title', '')[:80],
                     'relevance': r.get('score', 0)
                 })
             
-            prompt = f"""
-            Refine this search query based on context and previous results:
-            
-            Original Query: {query}
-            Context: {context}
-            Previous Results: {json.dumps(result_summary, indent=2)}
-            
-            Suggest:
-            1. A refined query that better captures intent
-            2. Alternative search strategies
-            3. Filters or constraints to apply
-            
-            Format as JSON with keys: refined_query, strategy, filters
-            """
+            prompt = _REFINE_SEARCH_TMPL.format_map({
+                'query': query,
+                'context': context,
+                'previous_results': _dumps_indented(result_summary)
+            })
             
-            response = await asyncio.to_thread(
-                openai.ChatCompletion.create,
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7
-            )
+            content = await cached_chat(prompt, model="gpt-3.5-turbo", temperature=0.7)
             
-            refinement = json.loads(response.choices[0].message.content)
+            refinement = _loads(content)
             refinement['original_query'] = query
             
             return refinement
@@ -0,0 +1,479 @@
+"""
+Semantic response cache for LLM chat completions.
+
+Prompts are looked up in a table of precomputed warmup responses, then by
+exact hash. Callers that pass a semantic key (the prompt's variable parts,
+without its template text) are also matched by cosine similarity of that
+key's embedding against previously answered keys for the same model. When
+hnswlib is installed the similarity lookup uses an HNSW index; otherwise it
+falls back to a NumPy scan over all cached embeddings, which are stored as
+int8 with a per-row scale. Prompt embeddings
+requested within a few milliseconds of each other are coalesced into a single
+embeddings API call. The cache can be saved to and reloaded from disk so a
+restarted server keeps its hits.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+import openai
+
+from services.quantize import quantize
+
+from .llm_rate_limiter import Pacer, estimate_tokens, pacer_from_env, retry_after_seconds
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of inputs the embeddings endpoint accepts per request
+MAX_EMBED_BATCH = 2048
+
+# Completion tokens budgeted per chat request, since callers don't set max_tokens
+EXPECTED_COMPLETION_TOKENS = 500
+
+# Path prefix for the persisted cache; '.npy' holds embeddings, '.json' everything else
+LLM_CACHE_PATH = os.getenv(
+    'LLM_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'llm_cache')
+)
+
+
+class SemanticLLMCache:
+    """LRU + TTL cache of chat completions with exact and semantic lookup"""
+
+    def __init__(self, client: Optional[openai.AsyncOpenAI] = None, similarity_threshold: float = 0.90,
+                 max_entries: int = 1024, ttl_seconds: float = 3600,
+                 embedding_model: str = "text-embedding-3-small", embed_window_ms: float = 8,
+                 pacer: Optional[Pacer] = None, max_retries: int = 3):
+        self.client = client
+        self.pacer = pacer
+        self.max_retries = max_retries
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embedding_model = embedding_model
+        self.embed_window = embed_window_ms / 1000
+
+        # Pending (text, future) pairs drained by a single batching consumer
+        self._embed_queue: Optional[asyncio.Queue] = None
+
+        # key -> future for prompts whose answer is currently being fetched
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._embed_worker: Optional[asyncio.Task] = None
+
+        # key -> (monotonic creation time, response) for warmup prompts; never evicted
+        # to make room, but expires after ttl_seconds like any other entry
+        self._precomputed: Dict[str, Tuple[float, str]] = {}
+
+        # key -> {'model', 'prompt', 'response', 'row', 'created'}; order tracks recency.
+        # row is None for entries cached without a semantic key (exact match only).
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        # Normalized prompt embeddings, one row per entry, allocated on first insert.
+        # They live in exactly one place: the HNSW index (row numbers are its labels)
+        # when hnswlib is installed, otherwise an int8 matrix with per-row scales.
+        self._matrix: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._index = None
+        self._row_keys: List[Optional[str]] = [None] * max_entries
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+
+        self.precomputed_hits = 0
+        self.hits = 0
+        self.semantic_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    async def chat(self, prompt: str, model: str, temperature: float, semantic_key: Optional[str] = None) -> str:
+        """Return the completion for prompt, calling the API only on a cache miss.
+
+        Without a semantic_key only exact prompt matches hit. With one, answers to
+        keys whose embeddings are within the similarity threshold also hit.
+        """
+
+        key = self._key(prompt, model)
+
+        precomputed = self._precomputed.get(key)
+        if precomputed is not None:
+            if time.monotonic() - precomputed[0] <= self.ttl_seconds:
+                self.precomputed_hits += 1
+                return precomputed[1]
+            del self._precomputed[key]
+
+        entry = self._get(key)
+        if entry:
+            self.hits += 1
+            return entry['response']
+
+        # Identical prompts already being answered share that request
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            content = await self._resolve(key, prompt, model, temperature, semantic_key)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved in case no other caller was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(content)
+            return content
+        finally:
+            del self._inflight[key]
+            # Don't leave waiters hanging if this caller was cancelled
+            if not future.done():
+                future.cancel()
+
+    async def _resolve(self, key: str, prompt: str, model: str, temperature: float,
+                       semantic_key: Optional[str]) -> str:
+        """Answer a prompt missing from the exact cache via semantic lookup or the API"""
+
+        embedding = None
+        if semantic_key is not None:
+            embedding = await self._embed(semantic_key)
+
+            entry = self._get_similar(embedding, model)
+            if entry:
+                self.semantic_hits += 1
+                return entry['response']
+
+        self.misses += 1
+        content = await self._complete(prompt, model, temperature)
+
+        self._put(key, model, prompt, content, embedding)
+        return content
+
+    async def warmup(self, prompts: List[str], model: str, temperature: float):
+        """Precompute responses for known cold-start prompts"""
+
+        if self.client is None:
+            return
+
+        async def _precompute(prompt: str):
+            key = self._key(prompt, model)
+            cached = self._precomputed.get(key)
+            if cached is None or time.monotonic() - cached[0] > self.ttl_seconds:
+                # Always ask the model; a near-duplicate template must not borrow another's answer
+                response = await self._complete(prompt, model, temperature)
+                self._precomputed[key] = (time.monotonic(), response)
+
+        results = await asyncio.gather(*(_precompute(p) for p in prompts), return_exceptions=True)
+        failed = sum(1 for r in results if isinstance(r, Exception))
+        logger.info("Precomputed %d of %d warmup prompts", len(prompts) - failed, len(prompts))
+
+    def save(self, path: str):
+        """Write the cache to path.npy (embeddings of semantic entries) and path.json (all entries), oldest first"""
+
+        # Creation times are saved as wall-clock timestamps so time spent down still counts toward the TTL
+        now = time.monotonic()
+        wall_now = time.time()
+        entries = []
+        rows = []
+        for key, entry in self._entries.items():
+            row = entry['row']
+            entries.append({
+                'key': key,
+                'model': entry['model'],
+                'prompt': entry['prompt'],
+                'response': entry['response'],
+                # Index into the saved embeddings, or None for exact-match-only entries
+                'embedding': None if row is None else len(rows),
+                'scale': float(self._scales[row]) if row is not None and self._matrix is not None else 1.0,
+                'created': wall_now - (now - entry['created'])
+            })
+            if row is not None:
+                rows.append(row)
+        precomputed = {
+            key: {'response': response, 'created': wall_now - (now - created)}
+            for key, (created, response) in self._precomputed.items()
+        }
+        if self._index is not None:
+            embeddings = np.asarray(self._index.get_items(rows), dtype=np.float32).reshape(len(rows), self._index.dim)
+        elif self._matrix is not None:
+            embeddings = self._matrix[rows]
+        else:
+            embeddings = np.zeros((0, 0), dtype=np.int8)
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        # Write to temporary files first so a crash never leaves a half-written cache
+        with open(f"{path}.npy.tmp", 'wb') as f:
+            np.save(f, embeddings)
+        with open(f"{path}.json.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'entries': entries, 'precomputed': precomputed}, f)
+        os.replace(f"{path}.npy.tmp", f"{path}.npy")
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+
+        logger.info("Saved %d LLM cache entries to %s", len(entries), path)
+
+    def load(self, path: str):
+        """Restore entries saved by save(), skipping any that have since expired (or carry no timestamp)"""
+
+        if not (os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json")):
+            return
+
+        try:
+            with open(f"{path}.json", encoding='utf-8') as f:
+                data = json.load(f)
+            embeddings = np.load(f"{path}.npy", mmap_mode='r')
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable LLM cache at %s: %s", path, e)
+            return
+
+        if len(embeddings) != sum(entry.get('embedding') is not None for entry in data['entries']):
+            logger.warning("Ignoring inconsistent LLM cache at %s", path)
+            return
+
+        # Ages are measured on the wall clock, then mapped back onto the monotonic clock
+        now = time.monotonic()
+        wall_now = time.time()
+
+        for key, saved in data.get('precomputed', {}).items():
+            age = max(0.0, wall_now - saved['created']) if isinstance(saved, dict) else None
+            if age is not None and age <= self.ttl_seconds:
+                self._precomputed[key] = (now - age, saved['response'])
+
+        for entry in data['entries']:
+            age = max(0.0, wall_now - entry['created']) if 'created' in entry else None
+            if age is None or age > self.ttl_seconds:
+                continue
+            embedding = None
+            if entry.get('embedding') is not None:
+                embedding = np.asarray(embeddings[entry['embedding']], dtype=np.float32) * entry.get('scale', 1.0)
+            self._put(entry['key'], entry['model'], entry['prompt'], entry['response'], embedding)
+            self._entries[entry['key']]['created'] = now - age
+
+        logger.info("Loaded %d LLM cache entries from %s", len(self._entries), path)
+
+    async def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embed texts with as few API calls as possible, returning normalized rows"""
+
+        # Request base64 so each vector arrives as raw float32 bytes rather than a list of Python floats
+        raw = bytearray()
+        for start in range(0, len(texts), MAX_EMBED_BATCH):
+            response = await self.client.embeddings.create(
+                model=self.embedding_model,
+                input=texts[start:start + MAX_EMBED_BATCH],
+                encoding_format="base64"
+            )
+            for item in response.data:
+                raw += base64.b64decode(item.embedding)
+
+        embeddings = np.frombuffer(raw, dtype=np.float32).reshape(len(texts), -1)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters"""
+
+        return {
+            'entries': len(self._entries),
+            'precomputed': len(self._precomputed),
+            'precomputed_hits': self.precomputed_hits,
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'coalesced': self.coalesced,
+            'misses': self.misses
+        }
+
+    async def aclose(self):
+        """Stop the embedding batcher and close the underlying HTTP connection pool"""
+
+        if self._embed_worker:
+            self._embed_worker.cancel()
+            self._embed_worker = None
+
+        if self.client:
+            await self.client.close()
+
+    # ------------------------- Internal helpers -----------------------------
+
+    async def _complete(self, prompt: str, model: str, temperature: float) -> str:
+        tokens = estimate_tokens(prompt, model) + EXPECTED_COMPLETION_TOKENS if self.pacer else 0
+
+        for attempt in range(self.max_retries + 1):
+            if self.pacer:
+                await self.pacer.acquire(tokens)
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature
+                )
+                return response.choices[0].message.content
+            except openai.RateLimitError as e:
+                if not self.pacer or attempt == self.max_retries:
+                    raise
+                await self.pacer.backoff(retry_after_seconds(e))
+
+    def _key(self, prompt: str, model: str) -> str:
+        return hashlib.sha256(f"{model}|{prompt}".encode('utf-8')).hexdigest()
+
+    async def _embed(self, text: str) -> np.ndarray:
+        # (Re)start the consumer lazily so it is bound to the running event loop
+        if self._embed_worker is None or self._embed_worker.done():
+            self._embed_queue = asyncio.Queue()
+            self._embed_worker = asyncio.create_task(self._embed_batcher())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._embed_queue.put((text, future))
+        return await future
+
+    async def _embed_batcher(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            pending: List[Tuple[str, asyncio.Future]] = [await self._embed_queue.get()]
+
+            # Collect whatever else arrives within the window
+            deadline = loop.time() + self.embed_window
+            while len(pending) < MAX_EMBED_BATCH:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self._embed_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                embeddings = await self.embed_batch([text for text, _ in pending])
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(pending, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if time.monotonic() - entry['created'] > self.ttl_seconds:
+            self._evict(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def _get_similar(self, embedding: np.ndarray, model: str) -> Optional[Dict[str, Any]]:
+        if not self._entries or (self._index is None and self._matrix is None):
+            return None
+
+        if self._index is not None:
+            # Evicted rows stay in the index until reused, so look past a few of them
+            k = min(4, self._index.get_current_count())
+            labels, distances = self._index.knn_query(embedding, k=k)
+            candidates = zip(labels[0].tolist(), (1.0 - distances[0]).tolist())
+        else:
+            # Integer dot products accumulate in int32, then rescale to cosine similarity
+            query, query_scale = quantize(embedding)
+            sims = np.einsum('ij,j->i', self._matrix, query, dtype=np.int32) * (self._scales * query_scale)
+            row = int(np.argmax(sims))
+            candidates = [(row, float(sims[row]))]
+
+        for row, similarity in candidates:
+            if similarity < self.similarity_threshold:
+                break
+
+            key = self._row_keys[row]
+            if key is None:
+                continue
+
+            entry = self._get(key)
+            if entry is not None and entry['model'] == model:
+                return entry
+
+        return None
+
+    def _put(self, key: str, model: str, prompt: str, response: str, embedding: Optional[np.ndarray]):
+        if key in self._entries:
+            self._evict(key)
+
+        # Entries without an embedding are exact-match only and take no row
+        while len(self._entries) >= self.max_entries or (embedding is not None and not self._free_rows):
+            self._evict(next(iter(self._entries)))
+
+        row = None
+        if embedding is not None:
+            if self._index is None and self._matrix is None:
+                if hnswlib is not None:
+                    self._index = hnswlib.Index(space='cosine', dim=embedding.shape[0])
+                    self._index.init_index(max_elements=self.max_entries, ef_construction=200, M=16)
+                    self._index.set_ef(50)
+                else:
+                    self._matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.int8)
+                    self._scales = np.zeros(self.max_entries, dtype=np.float32)
+
+            row = self._free_rows.pop()
+            if self._index is not None:
+                # Re-adding an existing label replaces its vector
+                self._index.add_items(embedding[None, :], np.array([row]))
+            else:
+                self._matrix[row], self._scales[row] = quantize(embedding)
+            self._row_keys[row] = key
+
+        self._entries[key] = {
+            'model': model,
+            'prompt': prompt,
+            'response': response,
+            'row': row,
+            'created': time.monotonic()
+        }
+
+    def _evict(self, key: str):
+        entry = self._entries.pop(key)
+        row = entry['row']
+        if row is None:
+            return
+        if self._matrix is not None:
+            self._matrix[row] = 0
+            self._scales[row] = 0.0
+        self._row_keys[row] = None
+        self._free_rows.append(row)
+
+
+_cached_llm: Optional[SemanticLLMCache] = None
+
+
+def get_cached_llm() -> SemanticLLMCache:
+    """Get the process-wide semantic LLM cache"""
+
+    global _cached_llm
+    if _cached_llm is None:
+        api_key = os.getenv('OPENAI_API_KEY', '')
+        client = openai.AsyncOpenAI(
+            api_key=api_key,
+            http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=100))
+        ) if api_key else None
+        _cached_llm = SemanticLLMCache(client, pacer=pacer_from_env())
+        _cached_llm.load(LLM_CACHE_PATH)
+    return _cached_llm
+
+
+async def cached_chat(prompt: str, model: str, temperature: float, semantic_key: Optional[str] = None) -> str:
+    """Get a chat completion through the process-wide semantic cache"""
+
+    return await get_cached_llm().chat(prompt, model, temperature, semantic_key)
@@ -0,0 +1,133 @@
+"""
+Request and token pacing for OpenAI API calls.
+
+Keeps callers under the account's requests-per-minute and tokens-per-minute
+limits by refilling both budgets continuously and making callers wait until
+enough of each is available, instead of letting bursts run into 429s.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+
+class Pacer:
+    """Leaky-bucket limiter over requests and tokens per minute"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, cooldown_seconds: float = 15):
+        self.max_requests = requests_per_minute
+        self.max_tokens = tokens_per_minute
+        self.cooldown_seconds = cooldown_seconds
+
+        self.available_requests = requests_per_minute
+        self.available_tokens = tokens_per_minute
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+
+        # Serializes waiters so budget is handed out in arrival order
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        """Wait until one request and the given number of tokens fit in the budget"""
+
+        # A single oversized request can never fit; let it through on a full bucket
+        tokens = min(tokens, self.max_tokens)
+
+        async with self._lock:
+            while True:
+                self._refill()
+                now = time.monotonic()
+
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.available_requests >= 1 and self.available_tokens >= tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= tokens
+                    return
+                else:
+                    wait = max(
+                        (1 - self.available_requests) * 60 / self.max_requests,
+                        (tokens - self.available_tokens) * 60 / self.max_tokens,
+                        0.001
+                    )
+
+                await asyncio.sleep(wait)
+
+    async def backoff(self, retry_after: Optional[float] = None):
+        """Pause all callers after the API reported a rate limit, for retry_after seconds if it said how long"""
+
+        pause = retry_after if retry_after is not None else self.cooldown_seconds
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        logger.warning("Rate limited by the API, pausing requests for %.1fs", pause)
+        await asyncio.sleep(self._paused_until - time.monotonic())
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+
+        self.available_requests = min(self.max_requests, self.available_requests + elapsed * self.max_requests / 60)
+        self.available_tokens = min(self.max_tokens, self.available_tokens + elapsed * self.max_tokens / 60)
+
+
+@lru_cache(maxsize=None)
+def _encoding_for(model: str):
+    """tiktoken encoding for a model, or None when tiktoken cannot provide one (e.g. no cached BPE file offline)"""
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # Unknown model name, or its encoding could not be loaded
+        pass
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning("No tiktoken encoding for %s, approximating token counts: %s", model, e)
+        return None
+
+
+def approximate_tokens(text: str) -> int:
+    """Approximate a token count at ~4 characters per token"""
+
+    return len(text) // 4 + 1
+
+
+def estimate_tokens(text: str, model: str) -> int:
+    """Count prompt tokens with tiktoken, or approximate at ~4 characters per token"""
+
+    encoding = _encoding_for(model) if tiktoken else None
+    if encoding is None:
+        return approximate_tokens(text)
+    try:
+        return len(encoding.encode(text))
+    except Exception:
+        return approximate_tokens(text)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the Retry-After header from an OpenAI API error, if it carries one"""
+
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def pacer_from_env() -> Pacer:
+    """Build a Pacer from OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT"""
+
+    return Pacer(
+        requests_per_minute=float(os.getenv('OPENAI_RPM_LIMIT', '3500')),
+        tokens_per_minute=float(os.getenv('OPENAI_TPM_LIMIT', '90000'))
+    )
@@ -1,14 +1,33 @@
 import asyncio
-from typing import Dict, Any, List
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Iterator, Tuple, Callable
 import logging
 from .transcript_fetcher import TranscriptFetcher
 from .text_chunker import TextChunker
 from .vector_embedder import VectorEmbedder
 from .query_processor import QueryProcessor
 from .reflection_agent import ReflectionAgent
+from .iterative_explorer import build_alternative_query_prompt
+from .llm_cache import get_cached_llm
 
 logger = logging.getLogger(__name__)
 
+# watch?v=, youtu.be/, embed/ and v/ URLs in a single scan
+_YT_ID_RE = re.compile(r'(?:youtube\.com/(?:watch\?v=|embed/|v/)|youtu\.be/)([^&\n?#]+)')
+
+# Learning goals common enough that their cold-start prompts are worth precomputing (LLM_WARMUP=1)
+WARMUP_LEARNING_GOALS = [
+    "machine learning",
+    "python programming",
+    "data structures and algorithms",
+    "web development",
+    "linear algebra",
+    "system design"
+]
+
 class AgentOrchestrator:
     """Orchestrates the multi-agent system for YouTube transcript processing"""
     
@@ -28,6 +47,20 @@ class AgentOrchestrator:
         # Track active workflows
         self.active_workflows = {}
         
+        # Status snapshots served to pollers: name -> (monotonic timestamp, value)
+        self.status_ttl = 1.0
+        self._status_cache: Dict[str, Tuple[float, Any]] = {}
+        
+    async def warmup(self, learning_goals: List[str] = WARMUP_LEARNING_GOALS):
+        """Precompute cached LLM responses for common exploration topics"""
+        
+        if not os.getenv('OPENAI_API_KEY'):
+            return
+        
+        # A fresh exploration of a goal starts from the goal itself as the query
+        prompts = [build_alternative_query_prompt(goal, goal) for goal in learning_goals]
+        await get_cached_llm().warmup(prompts, model="gpt-3.5-turbo", temperature=0.7)
+        
     async def process_video(self, youtube_url: str) -> Dict[str, Any]:
         """Process a YouTube video through the complete pipeline"""
         
@@ -37,73 +70,66 @@ class AgentOrchestrator:
             raise ValueError("Invalid YouTube URL")
         
         workflow_id = f"video_{youtube_id}"
-        self.active_workflows[workflow_id] = {
-            'status': 'processing',
-            'current_step': 'fetching_transcript',
-            'progress': 0
-        }
         
-        try:
-            logger.info(f"Starting video processing pipeline for {youtube_id}")
-            
-            # Step 1: Fetch transcript
-            self._update_workflow(workflow_id, 'fetching_transcript', 25)
-            transcript_task = {
-                'type': 'fetch_transcript',
-                'youtube_id': youtube_id
-            }
-            transcript_result = await self.transcript_fetcher.process_task(transcript_task)
-            
-            # Step 2: Chunk transcript
-            self._update_workflow(workflow_id, 'chunking_text', 50)
-            chunking_task = {
-                'type': 'chunk_text',
-                'transcript': transcript_result['transcript'],
-                'youtube_id': youtube_id,
-                'raw_transcript': transcript_result['raw_transcript']
-            }
-            chunking_result = await self.text_chunker.process_task(chunking_task)
-            
-            # Step 3: Create embeddings
-            self._update_workflow(workflow_id, 'creating_embeddings', 75)
-            embedding_task = {
-                'type': 'create_embeddings',
-                'chunks': chunking_result['chunks'],
-                'youtube_id': youtube_id
-            }
-            embedding_result = await self.vector_embedder.process_task(embedding_task)
-            
-            # Step 4: Update vector index
-            self._update_workflow(workflow_id, 'updating_index', 90)
-            index_task = {
-                'type': 'update_index'
-            }
-            await self.vector_embedder.process_task(index_task)
-            
-            # Complete workflow
-            self._update_workflow(workflow_id, 'completed', 100)
-            
-            # Combine results
-            result = {
-                'youtube_id': youtube_id,
-                'video_info': transcript_result['video_info'],
-                'transcript': transcript_result['transcript'],
-                'chunks': embedding_result['embedded_chunks'],
-                'total_chunks': len(embedding_result['embedded_chunks']),
-                'workflow_id': workflow_id,
-                'status': 'completed'
-            }
-            
-            logger.info(f"Video processing pipeline completed for {youtube_id}")
-            return result
-            
-        except Exception as e:
-            self._update_workflow(workflow_id, 'error', 0)
-            logger.error(f"Video processing pipeline failed for {youtube_id}: {str(e)}")
-            raise
-        finally:
-            # Clean up workflow tracking
-            self.active_workflows.pop(workflow_id, None)
+        with self._workflow(workflow_id) as workflow:
+            try:
+                logger.info(f"Starting video processing pipeline for {youtube_id}")
+                
+                # Step 1: Fetch transcript
+                self._update_workflow(workflow, 'fetching_transcript', 25)
+                transcript_task = {
+                    'type': 'fetch_transcript',
+                    'youtube_id': youtube_id
+                }
+                transcript_result = await self.transcript_fetcher.process_task(transcript_task)
+                
+                # Step 2: Chunk transcript
+                self._update_workflow(workflow, 'chunking_text', 50)
+                chunking_task = {
+                    'type': 'chunk_text',
+                    'transcript': transcript_result['transcript'],
+                    'youtube_id': youtube_id,
+                    'raw_transcript': transcript_result['raw_transcript']
+                }
+                chunking_result = await self.text_chunker.process_task(chunking_task)
+                
+                # Step 3: Create embeddings
+                self._update_workflow(workflow, 'creating_embeddings', 75)
+                embedding_task = {
+                    'type': 'create_embeddings',
+                    'chunks': chunking_result['chunks'],
+                    'youtube_id': youtube_id
+                }
+                embedding_result = await self.vector_embedder.process_task(embedding_task)
+                
+                # Step 4: Update vector index
+                self._update_workflow(workflow, 'updating_index', 90)
+                index_task = {
+                    'type': 'update_index'
+                }
+                await self.vector_embedder.process_task(index_task)
+                
+                # Complete workflow
+                self._update_workflow(workflow, 'completed', 100)
+                
+                # Combine results
+                result = {
+                    'youtube_id': youtube_id,
+                    'video_info': transcript_result['video_info'],
+                    'transcript': transcript_result['transcript'],
+                    'chunks': embedding_result['embedded_chunks'],
+                    'total_chunks': len(embedding_result['embedded_chunks']),
+                    'workflow_id': workflow_id,
+                    'status': 'completed'
+                }
+                
+                logger.info(f"Video processing pipeline completed for {youtube_id}")
+                return result
+                
+            except Exception as e:
+                self._update_workflow(workflow, 'error', 0)
+                logger.error(f"Video processing pipeline failed for {youtube_id}: {str(e)}")
+                raise
     
     async def process_query(self, query: str) -> Dict[str, Any]:
         """Process a user query through the search and response pipeline"""
@@ -135,17 +161,22 @@ class AgentOrchestrator:
             raise
     
     def get_agent_statuses(self) -> List[Dict[str, Any]]:
-        """Get status of all agents"""
+        """Get status of all agents, at most status_ttl seconds old"""
         
-        return [
+        return self._cached_status('agent_statuses', lambda: [
             self.transcript_fetcher.get_status(),
             self.text_chunker.get_status(),
             self.vector_embedder.get_status(),
             self.query_processor.get_status()
-        ]
+        ])
     
     def get_system_metrics(self) -> Dict[str, Any]:
-        """Get overall system metrics"""
+        """Get overall system metrics, at most status_ttl seconds old"""
+        
+        return self._cached_status('system_metrics', self._compute_system_metrics)
+    
+    def _compute_system_metrics(self) -> Dict[str, Any]:
+        """Compute overall system metrics from fresh agent statuses"""
         
         agent_statuses = self.get_agent_statuses()
         
@@ -161,29 +192,43 @@ class AgentOrchestrator:
             'vector_stats': self.vector_embedder.get_vector_stats()
         }
     
-    def _extract_youtube_id(self, url: str) -> str:
-        """Extract YouTube video ID from URL"""
+    def _cached_status(self, name: str, compute: Callable[[], Any]) -> Any:
+        """Return a recent snapshot of name, recomputing it once it is older than status_ttl"""
         
-        import re
+        now = time.monotonic()
+        cached = self._status_cache.get(name)
+        if cached and now - cached[0] < self.status_ttl:
+            return cached[1]
         
-        patterns = [
-            r'(?:youtube\.com\/watch\?v=|youtu\.be\/)([^&\n?#]+)',
-            r'youtube\.com\/embed\/([^&\n?#]+)',
-            r'youtube\.com\/v\/([^&\n?#]+)'
-        ]
+        value = compute()
+        self._status_cache[name] = (now, value)
+        return value
+    
+    def _extract_youtube_id(self, url: str) -> str:
+        """Extract YouTube video ID from URL"""
         
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
+        match = _YT_ID_RE.search(url)
+        return match.group(1) if match else ""
+    
+    @contextmanager
+    def _workflow(self, workflow_id: str) -> Iterator[Dict[str, Any]]:
+        """Track a workflow's state for the duration of the block"""
         
-        return ""
+        state = {
+            'status': 'processing',
+            'current_step': 'fetching_transcript',
+            'progress': 0
+        }
+        self.active_workflows[workflow_id] = state
+        try:
+            yield state
+        finally:
+            # Only remove our own entry if the same video was resubmitted meanwhile
+            if self.active_workflows.get(workflow_id) is state:
+                del self.active_workflows[workflow_id]
     
-    def _update_workflow(self, workflow_id: str, step: str, progress: int):
+    def _update_workflow(self, workflow: Dict[str, Any], step: str, progress: int):
         """Update workflow status"""
         
-        if workflow_id in self.active_workflows:
-            self.active_workflows[workflow_id].update({
-                'current_step': step,
-                'progress': progress
-            })
+        workflow['current_step'] = step
+        workflow['progress'] = progress
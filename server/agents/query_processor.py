@@ -1,7 +1,51 @@
 import os
+import re
 import asyncio
-from typing import Dict, Any, List
+import numpy as np
+import openai
+from typing import Dict, Any, List, NamedTuple
 from .base_agent import BaseAgent
+from .ttl_cache import AsyncTTLCache, content_key
+
+# Relevance labels indexed by how many of RELEVANCE_THRESHOLDS a similarity reaches
+RELEVANCE_LEVELS = ("Very Low", "Low", "Medium", "High", "Very High")
+RELEVANCE_THRESHOLDS = np.array([0.2, 0.4, 0.6, 0.8])
+
+# Topic keywords recognized by the mock responses and title guesses, matched in one pass
+_TOPIC_RE = re.compile(r'quantum|photosynthesis|biology', re.IGNORECASE)
+
+# One "From video ..." block per context chunk
+_CONTEXT_PART_FMT = "From video {youtube_id} at {timestamp}:\n{content}\n".format_map
+
+# Prompt for answering a question from transcript context, filled with str.format_map
+_ANSWER_PROMPT_TMPL = """Based on the following YouTube video transcript context, please provide a comprehensive and accurate answer to the user's question.
+
+Context from video transcripts:
+{context}
+
+User's question: {query}
+
+Please provide a detailed, informative response that directly addresses the question using the information from the video transcripts. If the context doesn't contain enough information to fully answer the question, please indicate what information is available and what might be missing."""
+
+class ChunkColumns(NamedTuple):
+    """Fields of the selected context chunks, read once into parallel columns"""
+    contents: List[str]
+    youtube_ids: List[str]
+    start_times: List[str]
+    sims: np.ndarray
+
+def _to_columns(chunks: List[Dict]) -> ChunkColumns:
+    """Project chunk dicts into parallel columns so later passes index lists instead of dicts"""
+    return ChunkColumns(
+        [chunk.get('content', '') for chunk in chunks],
+        [chunk.get('youtube_id', '') for chunk in chunks],
+        [chunk.get('start_time', '00:00') for chunk in chunks],
+        np.fromiter((chunk.get('similarity', 0) for chunk in chunks), dtype=np.float64, count=len(chunks))
+    )
+
+def _topics(text: str) -> set:
+    """Return the lowercase topic keywords that occur anywhere in text"""
+    return {match.lower() for match in _TOPIC_RE.findall(text)}
 
 class QueryProcessor(BaseAgent):
     """Agent responsible for processing user queries and generating responses"""
@@ -13,8 +57,12 @@ class QueryProcessor(BaseAgent):
         )
         self.openai_api_key = os.getenv('OPENAI_API_KEY', '')
         self.google_api_key = os.getenv('GOOGLE_API_KEY', '')
+        # One client for every answer, so requests reuse its pooled connections
+        self.openai_client = openai.AsyncOpenAI(api_key=self.openai_api_key) if self.openai_api_key else None
         self.max_context_chunks = 5
         self.min_similarity_threshold = 0.3
+        # Generated answers keyed by (query, context); the same chunks recur across questions
+        self.response_cache = AsyncTTLCache(maxsize=256, ttl_seconds=600)
     
     async def process_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Process a query task"""
@@ -31,27 +79,27 @@ class QueryProcessor(BaseAgent):
         self.log_action(f"Processing query: {query[:50]}...")
         
         try:
-            # Filter chunks by similarity threshold
-            relevant_chunks = [
-                chunk for chunk in similar_chunks 
-                if chunk.get('similarity', 0) >= self.min_similarity_threshold
-            ][:self.max_context_chunks]
+            # Keep the most similar chunks above the similarity threshold
+            relevant_chunks = self._select_relevant_chunks(similar_chunks)
             
             if not relevant_chunks:
                 return await self._generate_no_context_response(query)
             
+            # Read chunk fields once; both the prompt and the source contexts use the columns
+            columns = _to_columns(relevant_chunks)
+            
             # Generate response with context
-            response = await self._generate_contextual_response(query, relevant_chunks)
+            response = await self._generate_contextual_response(query, columns)
             
-            # Prepare source contexts for frontend
-            source_contexts = self._prepare_source_contexts(relevant_chunks)
+            # Score all chunks in one pass and prepare source contexts for frontend
+            source_contexts = self._prepare_source_contexts(columns)
             
             result = {
                 'query': query,
                 'response': response,
                 'source_contexts': source_contexts,
                 'chunks_used': len(relevant_chunks),
-                'confidence': self._calculate_confidence(relevant_chunks)
+                'confidence': self._calculate_confidence(columns.sims)
             }
             
             self.log_action(f"Generated response using {len(relevant_chunks)} context chunks")
@@ -61,32 +109,27 @@ class QueryProcessor(BaseAgent):
             self.log_action(f"Failed to process query: {str(e)}", "error")
             raise
     
-    async def _generate_contextual_response(self, query: str, chunks: List[Dict]) -> str:
-        """Generate response using retrieved context chunks"""
+    def _select_relevant_chunks(self, chunks: List[Dict]) -> List[Dict]:
+        """Pick up to max_context_chunks chunks above the threshold, most similar first"""
         
-        # Prepare context from chunks
-        context_parts = []
-        for chunk in chunks:
-            content = chunk.get('content', '')
-            youtube_id = chunk.get('youtube_id', '')
-            timestamp = chunk.get('start_time', '')
-            
-            context_part = f"From video {youtube_id} at {timestamp}:\n{content}\n"
-            context_parts.append(context_part)
+        k = self.max_context_chunks
+        sims = np.fromiter((chunk.get('similarity', 0.0) for chunk in chunks), dtype=np.float32, count=len(chunks))
         
-        context = "\n".join(context_parts)
+        # Linear-time top-k; only the k survivors get sorted
+        idx = np.argpartition(sims, -k)[-k:] if len(sims) > k else np.arange(len(sims))
+        idx = idx[sims[idx] >= self.min_similarity_threshold]
+        idx = idx[np.lexsort((idx, -sims[idx]))]
         
-        # Create prompt for LLM
-        prompt = f"""Based on the following video transcript excerpts, please answer the user's question.
-
-Context from YouTube videos:
-{context}
-
-User Question: {query}
-
-Please provide a comprehensive answer based on the provided context. If the context doesn't fully answer the question, mention what information is available and what might be missing.
-
-Answer:"""
+        return [chunks[i] for i in idx]
+    
+    async def _generate_contextual_response(self, query: str, columns: ChunkColumns) -> str:
+        """Generate response using retrieved context chunks"""
+        
+        # Prepare context from chunks in a single join
+        context = "\n".join(
+            _CONTEXT_PART_FMT({'youtube_id': youtube_id, 'timestamp': timestamp, 'content': content})
+            for youtube_id, timestamp, content in zip(columns.youtube_ids, columns.start_times, columns.contents)
+        )
         
         # Mock LLM response (in production, use OpenAI or Google Gemini API)
         response = await self._generate_llm_response(query, context)
@@ -107,44 +150,42 @@ Answer:"""
         }
     
     async def _generate_llm_response(self, query: str, context: str) -> str:
-        """Generate LLM response using OpenAI API"""
+        """Generate LLM response using OpenAI API, reusing answers for repeated query/context pairs"""
         try:
-            import openai
-            import os
-            
             # Use OpenAI API if key is available
-            api_key = os.getenv('OPENAI_API_KEY')
-            if api_key:
-                client = openai.OpenAI(api_key=api_key)
-                
-                prompt = f"""Based on the following YouTube video transcript context, please provide a comprehensive and accurate answer to the user's question.
-
-Context from video transcripts:
-{context}
-
-User's question: {query}
-
-Please provide a detailed, informative response that directly addresses the question using the information from the video transcripts. If the context doesn't contain enough information to fully answer the question, please indicate what information is available and what might be missing."""
-
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "You are a helpful AI assistant that analyzes YouTube video transcripts and provides accurate, informative responses based on the content."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=500,
-                    temperature=0.7
+            if self.openai_client:
+                return await self.response_cache.get_or_compute(
+                    content_key('llm', query, context),
+                    lambda: self._call_llm(query, context)
                 )
-                
-                return response.choices[0].message.content.strip()
             else:
                 # Fallback to mock response
-                return await self._mock_llm_response(query, context)
+                return await self.response_cache.get_or_compute(
+                    content_key('mock', query, context),
+                    lambda: self._mock_llm_response(query, context)
+                )
         except Exception as e:
             self.log_action(f"Failed to generate LLM response: {e}", "warning")
             # Fallback to mock response
             return await self._mock_llm_response(query, context)
     
+    async def _call_llm(self, query: str, context: str) -> str:
+        """Ask the OpenAI chat API to answer query from context"""
+        
+        prompt = _ANSWER_PROMPT_TMPL.format_map({'context': context, 'query': query})
+
+        response = await self.openai_client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": "You are a helpful AI assistant that analyzes YouTube video transcripts and provides accurate, informative responses based on the content."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=500,
+            temperature=0.7
+        )
+        
+        return response.choices[0].message.content.strip()
+    
     async def _mock_llm_response(self, query: str, context: str) -> str:
         """Mock LLM response for demonstration"""
         
@@ -152,9 +193,9 @@ Please provide a detailed, informative response that directly addresses the ques
         await asyncio.sleep(0.5)
         
         # Generate a contextual response based on the query and context
-        query_lower = query.lower()
+        topics = _topics(query)
         
-        if 'quantum' in query_lower and 'biology' in query_lower:
+        if {'quantum', 'biology'} <= topics:
             return """Based on the analyzed YouTube transcripts, quantum effects in biology represent a fascinating intersection of quantum physics and biological systems. The transcripts reveal several key points:
 
 **Quantum Coherence in Photosynthesis**: The videos explain how plants utilize quantum mechanical principles to achieve remarkable energy transfer efficiency in their light-harvesting complexes. This involves quantum superposition states that allow energy to "try" multiple pathways simultaneously, finding the most efficient route.
@@ -165,7 +206,7 @@ Please provide a detailed, informative response that directly addresses the ques
 
 The research suggests that rather than being mere accidents, these quantum effects may be fundamental to how biological systems operate efficiently."""
 
-        elif 'photosynthesis' in query_lower:
+        elif 'photosynthesis' in topics:
             return """According to the video transcripts, photosynthesis demonstrates remarkable quantum effects that enable its high efficiency:
 
 **Energy Transfer Mechanism**: The light-harvesting complexes in plants use quantum coherence to create superposition states, allowing excitation energy to simultaneously explore multiple pathways and select the most efficient route to the reaction center.
@@ -184,61 +225,55 @@ Key themes that emerge from the analysis include detailed explanations of the un
 
 For more specific information, you might want to review the source contexts below, which show the exact excerpts from the videos that relate to your question."""
         
-    def _prepare_source_contexts(self, chunks: List[Dict]) -> List[Dict[str, Any]]:
+    def _prepare_source_contexts(self, columns: ChunkColumns) -> List[Dict[str, Any]]:
         """Prepare source contexts for the frontend display"""
         
         contexts = []
+        confidences = (columns.sims * 100).astype(int).tolist()
+        relevance = self._calculate_relevance(columns.sims)
         
-        for chunk in chunks:
+        for i, content in enumerate(columns.contents):
             # Mock video title extraction (in production, get from video metadata)
-            youtube_id = chunk.get('youtube_id', '')
-            video_title = f"Video {youtube_id}"
+            video_title = f"Video {columns.youtube_ids[i]}"
             
-            if 'quantum' in chunk.get('content', '').lower():
+            topics = _topics(content)
+            if 'quantum' in topics:
                 video_title = "Quantum Biology: From Photons to Physiology"
-            elif 'photosynthesis' in chunk.get('content', '').lower():
+            elif 'photosynthesis' in topics:
                 video_title = "Photosynthesis and Energy Transfer"
             
             context = {
                 'videoTitle': video_title,
-                'timestamp': chunk.get('start_time', '00:00'),
-                'excerpt': chunk.get('content', '')[:200] + "..." if len(chunk.get('content', '')) > 200 else chunk.get('content', ''),
-                'confidence': int(chunk.get('similarity', 0) * 100),
-                'relevance': self._calculate_relevance(chunk.get('similarity', 0))
+                'timestamp': columns.start_times[i],
+                'excerpt': f"{content[:200]}..." if len(content) > 200 else content,
+                'confidence': confidences[i],
+                'relevance': relevance[i]
             }
             
             contexts.append(context)
         
         return contexts
     
-    def _calculate_confidence(self, chunks: List[Dict]) -> int:
+    def _calculate_confidence(self, sims: np.ndarray) -> int:
         """Calculate overall confidence score for the response"""
         
-        if not chunks:
+        if not len(sims):
             return 0
         
         # Average similarity score
-        avg_similarity = sum(chunk.get('similarity', 0) for chunk in chunks) / len(chunks)
+        avg_similarity = float(sims.mean())
         
         # Convert to percentage and adjust based on number of chunks
         confidence = int(avg_similarity * 100)
         
         # Bonus for having multiple supporting chunks
-        if len(chunks) >= 3:
+        if len(sims) >= 3:
             confidence = min(confidence + 10, 100)
         
         return confidence
     
-    def _calculate_relevance(self, similarity: float) -> str:
-        """Calculate relevance level based on similarity score"""
-        
-        if similarity >= 0.8:
-            return "Very High"
-        elif similarity >= 0.6:
-            return "High"
-        elif similarity >= 0.4:
-            return "Medium"
-        elif similarity >= 0.2:
-            return "Low"
-        else:
-            return "Very Low"
+    def _calculate_relevance(self, sims: np.ndarray) -> List[str]:
+        """Calculate relevance levels based on similarity scores"""
+        
+        buckets = np.searchsorted(RELEVANCE_THRESHOLDS, sims, side='right')
+        return [RELEVANCE_LEVELS[b] for b in buckets.tolist()]
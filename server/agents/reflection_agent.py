@@ -2,11 +2,108 @@
 Reflection Agent implementing ReAct pattern for evaluating responses and suggesting improvements
 """
 
+import asyncio
 import json
 import openai
 import os
+import re
+from collections import Counter
 from typing import Dict, Any, List
 from .base_agent import BaseAgent
+from .ttl_cache import AsyncTTLCache, content_key
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fields every evaluation carries, with the values used when the LLM omits them
+_EVALUATION_DEFAULTS = {
+    'relevance_score': 5,
+    'accuracy_score': 5,
+    'completeness_score': 5,
+    'clarity_score': 5,
+    'source_utilization_score': 5,
+    'overall_score': 5,
+    'strengths': [],
+    'weaknesses': [],
+    'missing_information': [],
+    'factual_concerns': []
+}
+
+# Prompt for grading a Q&A interaction, filled with str.format_map
+_EVALUATION_PROMPT_TMPL = """
+You are an expert AI response evaluator. Analyze the quality of this Q&A interaction:
+
+ORIGINAL QUERY: {query}
+
+AI RESPONSE: {response}
+
+SOURCE CONTEXTS USED:
+{context_summary}
+
+Evaluate the response on these dimensions (scale 1-10):
+
+1. RELEVANCE: How well does the response address the specific question?
+2. ACCURACY: How factually correct is the information based on source contexts?
+3. COMPLETENESS: Does the response fully answer the question?
+4. CLARITY: How clear and understandable is the response?
+5. SOURCE_UTILIZATION: How effectively are the source contexts used?
+
+Respond in JSON format:
+{{
+    "relevance_score": <1-10>,
+    "accuracy_score": <1-10>,
+    "completeness_score": <1-10>,
+    "clarity_score": <1-10>,
+    "source_utilization_score": <1-10>,
+    "overall_score": <1-10>,
+    "strengths": ["list", "of", "strengths"],
+    "weaknesses": ["list", "of", "weaknesses"],
+    "missing_information": ["what", "could", "be", "added"],
+    "factual_concerns": ["any", "potential", "inaccuracies"]
+}}
+"""
+
+# Fixed evaluation returned when no OpenAI key is configured, serialized once
+_MOCK_EVALUATION_JSON = json.dumps({
+    "relevance_score": 7,
+    "accuracy_score": 8,
+    "completeness_score": 6,
+    "clarity_score": 8,
+    "source_utilization_score": 7,
+    "overall_score": 7,
+    "strengths": ["Clear explanation", "Good use of sources", "Well structured"],
+    "weaknesses": ["Could be more comprehensive", "Missing some context"],
+    "missing_information": ["More specific examples", "Additional background context"],
+    "factual_concerns": []
+})
+
+# Evaluation issues that trigger suggestions, matched in one pass per text
+_ISSUE_RE = re.compile(r'more specific|vague|incomplete|context|examples', re.IGNORECASE)
+
+# Candidate topic words for related-query suggestions
+_TOKEN_RE = re.compile(r'[a-z]{6,}')
+
+# (field, triggering issues, refined-query templates), in the order suggestions are offered
+_REFINEMENTS = (
+    ('weaknesses', frozenset({'more specific', 'vague'}), (
+        "Can you provide more specific details about {subject}?",
+        "What are the key technical aspects of {subject}?"
+    )),
+    ('missing_information', frozenset({'context'}), (
+        "What is the background context for {subject}?",
+        "How does {subject} relate to the broader field?"
+    )),
+    ('missing_information', frozenset({'examples'}), (
+        "Can you provide concrete examples of {subject}?",
+        "What are real-world applications of {subject}?"
+    ))
+)
+
+def _find_issues(items: List[str]) -> set:
+    """Return the lowercase issue keywords mentioned anywhere in items"""
+    return {match.lower() for match in _ISSUE_RE.findall(str(items))}
 
 
 class ReflectionAgent(BaseAgent):
@@ -17,7 +114,13 @@ class ReflectionAgent(BaseAgent):
             name="Reflection Agent",
             description="Evaluates response quality and suggests improvements using ReAct pattern"
         )
-        self.openai_client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        api_key = os.getenv('OPENAI_API_KEY')
+        self.openai_client = openai.AsyncOpenAI(api_key=api_key) if api_key else None
+        # Cap on concurrent evaluations in evaluate_batch, sized to stay under the QPM limit
+        self.max_parallel_evaluations = 20
+        self._eval_sem = asyncio.Semaphore(self.max_parallel_evaluations)
+        # Evaluations keyed by prompt, which covers the query, response and source contexts
+        self.evaluation_cache = AsyncTTLCache(maxsize=256, ttl_seconds=600)
     
     async def process_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Process a reflection task"""
@@ -26,6 +129,16 @@ class ReflectionAgent(BaseAgent):
             
             if task_type == 'evaluate_response':
                 return await self._evaluate_response(task)
+            elif task_type == 'evaluate_batch':
+                return {
+                    'success': True,
+                    'results': await self.evaluate_batch(task.get('tasks', []))
+                }
+            elif task_type == 'evaluate_offline':
+                return {
+                    'success': True,
+                    'results': await self.evaluate_offline(task.get('tasks', []))
+                }
             else:
                 return {
                     'success': False,
@@ -39,6 +152,97 @@ class ReflectionAgent(BaseAgent):
                 'error': str(e)
             }
     
+    async def evaluate_batch(self, tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Evaluate several responses concurrently, in input order"""
+        
+        async def _limited(task: Dict[str, Any]) -> Dict[str, Any]:
+            async with self._eval_sem:
+                return await self._evaluate_response(task)
+        
+        return await asyncio.gather(*(_limited(task) for task in tasks))
+    
+    async def evaluate_offline(self, tasks: List[Dict[str, Any]], poll_interval: float = 30,
+                               timeout: float = 3600) -> List[Dict[str, Any]]:
+        """Evaluate many responses through the OpenAI Batch API, in input order
+        
+        Batch jobs cost half as much as regular requests but may take up to 24h,
+        so this is meant for offline pipelines rather than interactive queries.
+        A batch still running after timeout seconds is cancelled. Tasks without
+        an evaluation come back as {'success': False, 'error': ...}.
+        """
+        
+        if not self.openai_client:
+            return await self.evaluate_batch(tasks)
+        
+        prompts = [
+            self._build_evaluation_prompt(task.get('query', ''), task.get('response', ''), task.get('source_contexts', []))
+            for task in tasks
+        ]
+        lines = "\n".join(
+            json.dumps({
+                'custom_id': str(i),
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': self._evaluation_request(prompt)
+            })
+            for i, prompt in enumerate(prompts)
+        )
+        
+        input_file = await self.openai_client.files.create(
+            file=("evaluations.jsonl", lines.encode('utf-8')),
+            purpose="batch"
+        )
+        batch = await self.openai_client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        self.log_action(f"Submitted batch {batch.id} with {len(tasks)} evaluations")
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while batch.status not in ('completed', 'failed', 'expired', 'cancelled'):
+            if loop.time() >= deadline:
+                # Nobody will read results that arrive later, so stop paying for them
+                self.log_action(f"Batch {batch.id} still '{batch.status}' after {timeout:.0f}s, cancelling", "error")
+                batch = await self.openai_client.batches.cancel(batch.id)
+                break
+            await asyncio.sleep(poll_interval)
+            batch = await self.openai_client.batches.retrieve(batch.id)
+        
+        # Results come back in arbitrary order, matched to tasks by custom_id;
+        # requests that failed are listed in the error file instead
+        evaluations = {}
+        errors = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            output = await self.openai_client.files.content(file_id)
+            for line in output.text.splitlines():
+                result = json.loads(line)
+                response = result.get('response') or {}
+                if response.get('status_code') == 200:
+                    evaluations[result['custom_id']] = response['body']['choices'][0]['message']['content']
+                else:
+                    error = result.get('error') or (response.get('body') or {}).get('error') or {}
+                    errors[result['custom_id']] = error.get('message') or f"status {response.get('status_code')}"
+        
+        if len(evaluations) < len(tasks):
+            self.log_action(f"Batch {batch.id} ended '{batch.status}' with {len(tasks) - len(evaluations)} evaluations missing", "error")
+        
+        results = []
+        for i, task in enumerate(tasks):
+            evaluation = evaluations.get(str(i))
+            if evaluation is None:
+                error = errors.get(str(i), f"No result: batch {batch.id} ended '{batch.status}'")
+                results.append({'success': False, 'error': f"Evaluation failed: {error}"})
+                continue
+            
+            query = task.get('query', '')
+            related_queries = await self._suggest_related_queries(query, task.get('source_contexts', []))
+            results.append(await self._reflect(query, evaluation, related_queries))
+        return results
+    
     async def _evaluate_response(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Evaluate response quality and suggest improvements"""
         try:
@@ -49,21 +253,13 @@ class ReflectionAgent(BaseAgent):
             # Construct evaluation prompt
             evaluation_prompt = self._build_evaluation_prompt(query, response, source_contexts)
             
-            # Get LLM evaluation
-            evaluation = await self._get_llm_evaluation(evaluation_prompt)
-            
-            # Parse evaluation results
-            parsed_evaluation = self._parse_evaluation(evaluation)
-            
-            # Generate suggestions based on evaluation
-            suggestions = await self._generate_suggestions(query, response, parsed_evaluation, source_contexts)
+            # Get LLM evaluation; related queries only need the contexts, so build them meanwhile
+            evaluation, related_queries = await asyncio.gather(
+                self._get_llm_evaluation(evaluation_prompt),
+                self._suggest_related_queries(query, source_contexts)
+            )
             
-            return {
-                'success': True,
-                'evaluation': parsed_evaluation,
-                'suggestions': suggestions,
-                'reflection_score': parsed_evaluation.get('overall_score', 0)
-            }
+            return await self._reflect(query, evaluation, related_queries)
             
         except Exception as e:
             self.log_action(f"Error evaluating response: {e}", "error")
@@ -72,6 +268,22 @@ class ReflectionAgent(BaseAgent):
                 'error': str(e)
             }
     
+    async def _reflect(self, query: str, evaluation: str, related_queries: List[str]) -> Dict[str, Any]:
+        """Turn raw evaluation JSON into the reflection result"""
+        
+        # Parse evaluation results
+        parsed_evaluation = self._parse_evaluation(evaluation)
+        
+        # Generate suggestions based on evaluation
+        suggestions = await self._generate_suggestions(query, parsed_evaluation, related_queries)
+        
+        return {
+            'success': True,
+            'evaluation': parsed_evaluation,
+            'suggestions': suggestions,
+            'reflection_score': parsed_evaluation.get('overall_score', 0)
+        }
+    
     def _build_evaluation_prompt(self, query: str, response: str, source_contexts: List[Dict]) -> str:
         """Build comprehensive evaluation prompt"""
         
@@ -80,146 +292,96 @@ class ReflectionAgent(BaseAgent):
             for i, ctx in enumerate(source_contexts[:3])
         ])
         
-        return f"""
-You are an expert AI response evaluator. Analyze the quality of this Q&A interaction:
-
-ORIGINAL QUERY: {query}
-
-AI RESPONSE: {response}
-
-SOURCE CONTEXTS USED:
-{context_summary}
-
-Evaluate the response on these dimensions (scale 1-10):
-
-1. RELEVANCE: How well does the response address the specific question?
-2. ACCURACY: How factually correct is the information based on source contexts?
-3. COMPLETENESS: Does the response fully answer the question?
-4. CLARITY: How clear and understandable is the response?
-5. SOURCE_UTILIZATION: How effectively are the source contexts used?
-
-Respond in JSON format:
-{{
-    "relevance_score": <1-10>,
-    "accuracy_score": <1-10>,
-    "completeness_score": <1-10>,
-    "clarity_score": <1-10>,
-    "source_utilization_score": <1-10>,
-    "overall_score": <1-10>,
-    "strengths": ["list", "of", "strengths"],
-    "weaknesses": ["list", "of", "weaknesses"],
-    "missing_information": ["what", "could", "be", "added"],
-    "factual_concerns": ["any", "potential", "inaccuracies"]
-}}
-"""
+        return _EVALUATION_PROMPT_TMPL.format_map({
+            'query': query,
+            'response': response,
+            'context_summary': context_summary
+        })
     
     async def _get_llm_evaluation(self, prompt: str) -> str:
         """Get LLM evaluation of the response"""
         try:
-            if not self.openai_client.api_key:
+            if not self.openai_client:
                 # Mock evaluation for demonstration
                 return self._mock_evaluation()
             
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert AI response evaluator. Provide detailed, objective analysis in JSON format."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.3
+            return await self.evaluation_cache.get_or_compute(
+                content_key(prompt),
+                lambda: self._request_llm_evaluation(prompt)
             )
             
-            return response.choices[0].message.content
-            
         except Exception as e:
             self.log_action(f"Error getting LLM evaluation: {e}", "error")
             return self._mock_evaluation()
     
+    async def _request_llm_evaluation(self, prompt: str) -> str:
+        """Ask the OpenAI chat API to evaluate the prompt"""
+        
+        response = await self.openai_client.chat.completions.create(**self._evaluation_request(prompt))
+        
+        return response.choices[0].message.content
+    
+    def _evaluation_request(self, prompt: str) -> Dict[str, Any]:
+        """Chat completion parameters for evaluating the prompt, shared by live and batch requests"""
+        
+        return {
+            'model': "gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
+            'messages': [
+                {
+                    "role": "system",
+                    "content": "You are an expert AI response evaluator. Provide detailed, objective analysis in JSON format."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            'response_format': {"type": "json_object"},
+            'temperature': 0.3
+        }
+    
     def _mock_evaluation(self) -> str:
         """Mock evaluation for demonstration purposes"""
-        return json.dumps({
-            "relevance_score": 7,
-            "accuracy_score": 8,
-            "completeness_score": 6,
-            "clarity_score": 8,
-            "source_utilization_score": 7,
-            "overall_score": 7,
-            "strengths": ["Clear explanation", "Good use of sources", "Well structured"],
-            "weaknesses": ["Could be more comprehensive", "Missing some context"],
-            "missing_information": ["More specific examples", "Additional background context"],
-            "factual_concerns": []
-        })
+        return _MOCK_EVALUATION_JSON
     
     def _parse_evaluation(self, evaluation_json: str) -> Dict[str, Any]:
         """Parse and validate evaluation JSON"""
         try:
-            evaluation = json.loads(evaluation_json)
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError, so one handler covers both parsers
+            evaluation = orjson.loads(evaluation_json) if orjson else json.loads(evaluation_json)
             
             # Ensure all required fields exist with defaults
-            required_fields = {
-                'relevance_score': 5,
-                'accuracy_score': 5,
-                'completeness_score': 5,
-                'clarity_score': 5,
-                'source_utilization_score': 5,
-                'overall_score': 5,
-                'strengths': [],
-                'weaknesses': [],
-                'missing_information': [],
-                'factual_concerns': []
-            }
-            
-            for field, default in required_fields.items():
-                if field not in evaluation:
-                    evaluation[field] = default
-            
-            return evaluation
+            return _EVALUATION_DEFAULTS | evaluation
             
         except json.JSONDecodeError:
             self.log_action("Failed to parse evaluation JSON", "error")
-            return {
-                'relevance_score': 5,
-                'accuracy_score': 5,
-                'completeness_score': 5,
-                'clarity_score': 5,
-                'source_utilization_score': 5,
-                'overall_score': 5,
-                'strengths': [],
-                'weaknesses': ["Evaluation parsing failed"],
-                'missing_information': [],
-                'factual_concerns': []
-            }
+            return {**_EVALUATION_DEFAULTS, 'weaknesses': ["Evaluation parsing failed"]}
     
-    async def _generate_suggestions(self, query: str, response: str, evaluation: Dict[str, Any], source_contexts: List[Dict]) -> Dict[str, Any]:
+    async def _generate_suggestions(self, query: str, evaluation: Dict[str, Any], related_queries: List[str]) -> Dict[str, Any]:
         """Generate actionable suggestions based on evaluation"""
         
         suggestions = {
             'refined_queries': [],
-            'related_queries': [],
+            'related_queries': related_queries,
             'search_suggestions': [],
             'next_steps': []
         }
         
         overall_score = evaluation.get('overall_score', 5)
-        weaknesses = evaluation.get('weaknesses', [])
         missing_info = evaluation.get('missing_information', [])
         
+        # Scan the evaluation text for issue keywords once for all suggestion types
+        issues = {
+            'weaknesses': _find_issues(evaluation.get('weaknesses', [])),
+            'missing_information': _find_issues(missing_info)
+        }
+        
         # Generate refined queries if response needs improvement
         if overall_score < 7:
-            suggestions['refined_queries'] = await self._suggest_refined_queries(query, weaknesses, missing_info)
-        
-        # Generate related queries for exploration
-        suggestions['related_queries'] = await self._suggest_related_queries(query, source_contexts)
+            suggestions['refined_queries'] = await self._suggest_refined_queries(query, issues)
         
         # Generate search suggestions for external research
-        if overall_score < 6 or 'incomplete' in str(weaknesses).lower():
+        if overall_score < 6 or 'incomplete' in issues['weaknesses']:
             suggestions['search_suggestions'] = self._suggest_search_keywords(query, missing_info)
         
         # Generate next steps based on evaluation
@@ -227,30 +389,23 @@ Respond in JSON format:
         
         return suggestions
     
-    async def _suggest_refined_queries(self, original_query: str, weaknesses: List[str], missing_info: List[str]) -> List[str]:
+    async def _suggest_refined_queries(self, original_query: str, issues: Dict[str, set]) -> List[str]:
         """Generate refined query suggestions"""
         
         # Base refined queries on identified issues
         refined_queries = []
+        subject = original_query.lower()
         
-        if 'more specific' in str(weaknesses).lower() or 'vague' in str(weaknesses).lower():
-            refined_queries.append(f"Can you provide more specific details about {original_query.lower()}?")
-            refined_queries.append(f"What are the key technical aspects of {original_query.lower()}?")
-        
-        if 'context' in str(missing_info).lower():
-            refined_queries.append(f"What is the background context for {original_query.lower()}?")
-            refined_queries.append(f"How does {original_query.lower()} relate to the broader field?")
-        
-        if 'examples' in str(missing_info).lower():
-            refined_queries.append(f"Can you provide concrete examples of {original_query.lower()}?")
-            refined_queries.append(f"What are real-world applications of {original_query.lower()}?")
+        for field, triggers, templates in _REFINEMENTS:
+            if issues[field] & triggers:
+                refined_queries.extend(template.format(subject=subject) for template in templates)
         
         # Generic improvements if no specific issues identified
         if not refined_queries:
             refined_queries = [
-                f"What are the most important points about {original_query.lower()}?",
-                f"Can you explain {original_query.lower()} in more detail?",
-                f"What are the practical implications of {original_query.lower()}?"
+                f"What are the most important points about {subject}?",
+                f"Can you explain {subject} in more detail?",
+                f"What are the practical implications of {subject}?"
             ]
         
         return refined_queries[:3]  # Return top 3 suggestions
@@ -260,19 +415,14 @@ Respond in JSON format:
         
         related_queries = []
         
-        # Extract key topics from source contexts
-        topics = set()
-        for context in source_contexts[:5]:
-            content = context.get('content', '').lower()
-            video_title = context.get('videoTitle', '').lower()
-            
-            # Extract potential topics (simple keyword extraction)
-            words = content.split() + video_title.split()
-            technical_terms = [word for word in words if len(word) > 5 and word.isalpha()]
-            topics.update(technical_terms[:3])
+        # Extract key topics from source contexts: the most frequent long words
+        text = "\n".join(
+            f"{context.get('content', '')} {context.get('videoTitle', '')}" for context in source_contexts[:5]
+        ).lower()
+        topics = [word for word, _ in Counter(_TOKEN_RE.findall(text)).most_common(3)]
         
         # Generate related queries from topics
-        for topic in list(topics)[:3]:
+        for topic in topics:
             related_queries.append(f"What is the significance of {topic} in this context?")
             related_queries.append(f"How does {topic} compare to other approaches?")
         
@@ -285,7 +435,7 @@ Respond in JSON format:
         
         related_queries.extend(generic_related)
         
-        return list(set(related_queries))[:4]  # Return unique queries, max 4
+        return list(dict.fromkeys(related_queries))[:4]  # Return unique queries, max 4
     
     def _suggest_search_keywords(self, query: str, missing_info: List[str]) -> List[str]:
         """Suggest YouTube search keywords for additional research"""
@@ -308,13 +458,14 @@ Respond in JSON format:
                 search_suggestions.append(f"{info} examples")
         
         # Generic search patterns
+        topic = ' '.join(key_terms[:2])
         search_suggestions.extend([
-            f"{' '.join(key_terms[:2])} conference talk",
-            f"{' '.join(key_terms[:2])} deep dive",
-            f"{' '.join(key_terms[:2])} latest research"
+            f"{topic} conference talk",
+            f"{topic} deep dive",
+            f"{topic} latest research"
         ])
         
-        return list(set(search_suggestions))[:4]
+        return list(dict.fromkeys(search_suggestions))[:4]
     
     def _suggest_next_steps(self, evaluation: Dict[str, Any], query: str) -> List[str]:
         """Suggest concrete next steps based on evaluation"""
@@ -1,9 +1,20 @@
 import os
 import asyncio
+import base64
+import heapq
+from collections import OrderedDict
 import numpy as np
-from typing import Dict, Any, List
+import openai
+from typing import Dict, Any, List, Optional
 
 from .base_agent import BaseAgent
+from .llm_rate_limiter import Pacer, approximate_tokens, retry_after_seconds
+from .ttl_cache import AsyncTTLCache, SimilarityTTLCache, content_key
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
 
 class SearchAgent(BaseAgent):
     """Agent responsible for searching through indexed video transcripts using keywords and semantic search"""
@@ -14,8 +25,19 @@ class SearchAgent(BaseAgent):
             description="Searches through indexed video transcripts using keywords and semantic search"
         )
 
-        # API key for embeddings
+        # API key for embeddings; one async client is reused for every request
         self.openai_api_key = os.getenv("OPENAI_API_KEY", "")
+        self.openai_client = openai.AsyncOpenAI(api_key=self.openai_api_key) if self.openai_api_key else None
+
+        # Cap on embedding requests in flight across concurrent searches
+        self._embed_sem = asyncio.Semaphore(int(os.getenv("OPENAI_EMBED_CONCURRENCY", "35")))
+
+        # Embedding models have their own rate limits; requests wait for budget and retry on 429s
+        self.embed_pacer = Pacer(
+            requests_per_minute=float(os.getenv("OPENAI_EMBED_RPM_LIMIT", "3000")),
+            tokens_per_minute=float(os.getenv("OPENAI_EMBED_TPM_LIMIT", "1000000"))
+        )
+        self.max_retries = 3
 
         # Shared vector database (imported lazily to avoid circular imports)
         try:
@@ -36,6 +58,21 @@ class SearchAgent(BaseAgent):
         # Optional re-ranking model (e.g. OpenAI text-embedding-3-small). Set RERANK_MODEL to empty to disable
         self.rerank_model = os.getenv("RERANK_MODEL", "text-embedding-3-small")  # leave default empty string to skip
 
+        # text-embedding-3 models can return shortened embeddings that keep their ranking quality;
+        # rerank vectors are only compared with each other, so fetch them at reduced size
+        self.rerank_dimensions = int(os.getenv("RERANK_DIMENSIONS", "256")) if self.rerank_model.startswith("text-embedding-3") else None
+
+        # Unit-length rerank embeddings of passage text, LRU-bounded; passages recur across queries
+        self.rerank_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.rerank_cache_size = 20000
+
+        # Query embeddings keyed by model + exact query text
+        self.query_embedding_cache = AsyncTTLCache(maxsize=1024, ttl_seconds=3600)
+
+        # Semantic search results reused for near-duplicate queries; SEMANTIC_CACHE=1 enables it
+        self.result_cache = SimilarityTTLCache(threshold=0.97, maxsize=512, ttl_seconds=600) if os.getenv("SEMANTIC_CACHE") == "1" else None
+        self._result_cache_db_version = -1
+
     async def process_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Handle a task coming from the orchestrator"""
 
@@ -68,19 +105,17 @@ class SearchAgent(BaseAgent):
     async def _keyword_search(self, query: str) -> Dict[str, Any]:
         """Naive keyword search over metadata/content in the vector store."""
 
-        if not self.vector_db:
+        if self.vector_db is None:
             raise RuntimeError("Vector database not initialised")
 
-        matches = []
-
-        for vector_id, meta in self.vector_db.metadata.items():
-            content = meta.get("content", "")
-            if query.lower() in content.lower():
-                matches.append({
-                    "id": vector_id,
-                    "similarity": 1.0,  # full keyword match scored high
-                    "metadata": meta,
-                })
+        matches = [
+            {
+                "id": vector_id,
+                "similarity": 1.0,  # full keyword match scored high
+                "metadata": self.vector_db.metadata[vector_id],
+            }
+            for vector_id in self.vector_db.search_text(query)
+        ]
 
         return {
             "query": query,
@@ -91,18 +126,34 @@ class SearchAgent(BaseAgent):
     async def _semantic_search(self, query: str) -> Dict[str, Any]:
         """Embedding-based similarity search via OpenAI + vector DB."""
 
-        if not self.vector_db:
+        if self.vector_db is None:
             raise RuntimeError("Vector database not initialised")
 
-        embedding = await self._get_embedding(query)
-
-        matches = self.vector_db.search_similar(
-            embedding, top_k=self.max_results, threshold=self.min_similarity_threshold
+        model = "text-embedding-ada-002"
+        embedding = await self.query_embedding_cache.get_or_compute(
+            content_key(model, query),
+            lambda: self._get_embedding(query, model=model)
         )
 
-        # Optional re-ranking step using smaller cross-encoder-style model
-        if self.rerank_model:
-            matches = await self._rerank(query, matches)
+        # Cached results go stale once more vectors are indexed
+        matches = None
+        if self.result_cache is not None:
+            if self.vector_db.version != self._result_cache_db_version:
+                self.result_cache.clear()
+                self._result_cache_db_version = self.vector_db.version
+            matches = self.result_cache.get(embedding)
+
+        if matches is None:
+            matches = self.vector_db.search_similar(
+                embedding, top_k=self.max_results, threshold=self.min_similarity_threshold
+            )
+
+            # Optional re-ranking step using smaller cross-encoder-style model
+            if self.rerank_model:
+                matches = await self._rerank(query, matches)
+
+            if self.result_cache is not None:
+                self.result_cache.put(embedding, matches)
 
         return {
             "query": query,
@@ -120,55 +171,88 @@ class SearchAgent(BaseAgent):
         for m in kw_res["results"]:
             combined.setdefault(m["id"], m)
 
-        # Re-rank by similarity if available else by keyword presence
-        ranked = sorted(combined.values(), key=lambda x: x.get("similarity", 0), reverse=True)
+        # Re-rank by similarity if available else by keyword presence; only the top results are ordered
+        ranked = heapq.nlargest(self.max_results, combined.values(), key=lambda x: x.get("similarity", 0))
 
         return {
             "query": query,
-            "total_results": len(ranked),
-            "results": ranked[: self.max_results],
+            "total_results": len(combined),
+            "results": ranked,
         }
 
     async def _rerank(self, query: str, matches: List[Dict[str, Any]]):
         """Re-rank retrieved passages using a (smaller) embedding model on the full chunk text."""
 
+        # The API rejects empty inputs, so passages without text keep their original score
+        embedded = [m for m in matches if m["metadata"].get("content", "")]
+        texts = [m["metadata"]["content"][:8192] for m in embedded]
+
+        # Passage embeddings are keyed by text, so edited chunks never reuse a stale vector
+        keys = [content_key(self.rerank_model, str(self.rerank_dimensions), text) for text in texts]
+        missing = {key: text for key, text in zip(keys, texts) if key not in self.rerank_cache}
+
         try:
-            query_emb = await self._get_embedding(query, model=self.rerank_model)
+            # Query and all uncached passages in one request; row 0 is the query
+            embeddings = await self._get_embeddings(
+                [query, *missing.values()], model=self.rerank_model, dimensions=self.rerank_dimensions
+            )
         except Exception:
             # Fallback – if rerank model fails, keep original ordering
             return matches
 
-        # Compute similarity with the rerank model per passage (sync within thread pool)
-        scored = []
-        for m in matches:
-            content = m["metadata"].get("content", "")
-            try:
-                chunk_emb = await self._get_embedding(content[:8192], model=self.rerank_model)
-                sim = float(np.dot(query_emb, chunk_emb) / (np.linalg.norm(query_emb) * np.linalg.norm(chunk_emb)))
-            except Exception:
-                sim = m.get("similarity", 0)
+        # Normalise every row once so cosine similarity is a plain dot product
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+        for key, embedding in zip(missing, embeddings[1:]):
+            self.rerank_cache[key] = embedding
+        for key in keys:
+            self.rerank_cache.move_to_end(key)
+        passages = np.stack([self.rerank_cache[key] for key in keys]) if keys else embeddings[1:]
+        while len(self.rerank_cache) > self.rerank_cache_size:
+            self.rerank_cache.popitem(last=False)
+
+        if simsimd:
+            # SIMD cosine distance kernel over all passages at once
+            sims = 1.0 - np.asarray(simsimd.cdist(embeddings[:1], passages, metric="cosine"))[0]
+        else:
+            sims = passages @ embeddings[0]
+        for m, sim in zip(embedded, sims.tolist()):
             m["similarity_rerank"] = sim
-            scored.append(m)
 
         # Sort by new score (fallback to original)
-        return sorted(scored, key=lambda x: x.get("similarity_rerank", x.get("similarity", 0)), reverse=True)
+        return sorted(matches, key=lambda x: x.get("similarity_rerank", x.get("similarity", 0)), reverse=True)
 
     async def _get_embedding(self, text: str, *, model: str = "text-embedding-ada-002") -> np.ndarray:
         """Obtain OpenAI embedding for the given text using the specified model (async wrapper)."""
 
-        import openai
+        return (await self._get_embeddings([text], model=model))[0]
+
+    async def _get_embeddings(self, texts: List[str], *, model: str = "text-embedding-ada-002",
+                              dimensions: Optional[int] = None) -> np.ndarray:
+        """Embed several texts in one OpenAI request; returns one float32 row per text, in order."""
 
-        if not self.openai_api_key:
+        if not self.openai_client:
             raise RuntimeError("OPENAI_API_KEY not set")
 
+        # Pacing only needs a rough count; tokenizing every input would block the event loop
+        tokens = sum(approximate_tokens(text) for text in texts)
+
         try:
-            client = openai.OpenAI(api_key=self.openai_api_key)
-            response = await asyncio.to_thread(
-                client.embeddings.create,
-                model=model,
-                input=text,
-            )
-            return np.array(response.data[0].embedding, dtype=np.float32)
+            for attempt in range(self.max_retries + 1):
+                await self.embed_pacer.acquire(tokens)
+                try:
+                    async with self._embed_sem:
+                        # Asking for base64 explicitly makes the SDK hand back the raw float32 bytes
+                        # instead of decoding them into Python float lists
+                        if dimensions:
+                            response = await self.openai_client.embeddings.create(model=model, input=texts, dimensions=dimensions, encoding_format="base64")
+                        else:
+                            response = await self.openai_client.embeddings.create(model=model, input=texts, encoding_format="base64")
+                    raw = bytearray().join(base64.b64decode(d.embedding) for d in response.data)
+                    return np.frombuffer(raw, dtype=np.float32).reshape(len(response.data), -1)
+                except openai.RateLimitError as e:
+                    if attempt == self.max_retries:
+                        raise
+                    await self.embed_pacer.backoff(retry_after_seconds(e))
         except Exception as e:
             self.log_action(f"Embedding request failed: {e}", "error")
             raise 
\ No newline at end of file
@@ -1,5 +1,6 @@
 import asyncio
-from typing import Dict, Any, List
+import bisect
+from typing import Dict, Any, List, Tuple
 from .base_agent import BaseAgent
 
 class TextChunker(BaseAgent):
@@ -51,138 +52,112 @@ class TextChunker(BaseAgent):
             raise
     
     def _recursive_split(self, text: str) -> List[str]:
-        """Recursively split text using different separators"""
+        """Split text into overlapping chunks, ending each at the coarsest separator near the size limit"""
         
         if len(text) <= self.chunk_size:
             return [text]
         
         chunks = []
+        start = 0
         
-        for separator in self.separators:
-            if separator in text:
-                splits = text.split(separator)
-                
-                current_chunk = ""
-                for split in splits:
-                    # If adding this split would exceed chunk size, save current chunk
-                    if len(current_chunk) + len(split) + len(separator) > self.chunk_size:
-                        if current_chunk:
-                            chunks.append(current_chunk.strip())
-                            # Start new chunk with overlap
-                            overlap_text = self._get_overlap_text(current_chunk)
-                            current_chunk = overlap_text + split
-                        else:
-                            # Split is too large, recursively split it
-                            sub_chunks = self._recursive_split(split)
-                            chunks.extend(sub_chunks[:-1])
-                            current_chunk = sub_chunks[-1] if sub_chunks else ""
-                    else:
-                        if current_chunk:
-                            current_chunk += separator + split
-                        else:
-                            current_chunk = split
-                
-                # Add the last chunk
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                
-                return chunks
-        
-        # If no separators found, split by character limit
-        return self._split_by_characters(text)
-    
-    def _get_overlap_text(self, text: str) -> str:
-        """Get overlap text for the next chunk"""
-        
-        if len(text) <= self.chunk_overlap:
-            return text + " "
-        
-        # Try to find a good break point for overlap
-        overlap_candidates = text[-self.chunk_overlap:].split(' ')
+        while len(text) - start > self.chunk_size:
+            end = self._chunk_end(text, start)
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            
+            # Start the next chunk up to chunk_overlap characters back, at a word boundary
+            # when the overlap has one and mid-word otherwise, but always moving forward
+            overlap_start = end - self.chunk_overlap
+            space_pos = text.find(' ', overlap_start, end)
+            if space_pos > start:
+                start = space_pos + 1
+            else:
+                start = overlap_start if overlap_start > start else end
         
-        # Remove the first word to avoid cutting in the middle
-        if len(overlap_candidates) > 1:
-            overlap_text = ' '.join(overlap_candidates[1:])
-        else:
-            overlap_text = text[-self.chunk_overlap:]
+        # Add the last chunk
+        chunk = text[start:].strip()
+        if chunk:
+            chunks.append(chunk)
         
-        return overlap_text + " " if overlap_text else ""
+        return chunks
     
-    def _split_by_characters(self, text: str) -> List[str]:
-        """Split text by character limit as fallback"""
+    def _chunk_end(self, text: str, start: int) -> int:
+        """Pick where a chunk beginning at start should end"""
         
-        chunks = []
-        start = 0
+        limit = start + self.chunk_size
         
-        while start < len(text):
-            end = start + self.chunk_size
-            
-            if end >= len(text):
-                chunks.append(text[start:])
-                break
-            
-            # Try to find a space near the end to avoid cutting words
-            space_pos = text.rfind(' ', start, end)
-            if space_pos > start:
-                end = space_pos
-            
-            chunks.append(text[start:end])
-            start = end - self.chunk_overlap if end - self.chunk_overlap > start else end
+        # Prefer the coarsest separator in the back half of the window so chunks don't come out tiny
+        half = start + self.chunk_size // 2
+        for separator in self.separators:
+            pos = text.rfind(separator, half, limit)
+            if pos != -1:
+                return pos + len(separator)
         
-        return chunks
+        # Otherwise the last separator of any kind, or a hard cut when there is none
+        fallback = max(text.rfind(separator, start, limit) + len(separator) for separator in self.separators)
+        return fallback if fallback > start + 1 else limit
     
     def _add_timestamps(self, chunks: List[str], raw_transcript: List[Dict]) -> List[Dict[str, Any]]:
         """Add timestamp information to chunks based on original transcript"""
         
+        transcript_index = self._index_transcript(raw_transcript)
         timestamped_chunks = []
         
         for i, chunk in enumerate(chunks):
-            # Try to find matching timestamp from original transcript
-            start_time, end_time = self._find_chunk_timestamps(chunk, raw_transcript)
+            # One split serves both timestamp matching and the word count
+            chunk_words = chunk.lower().split()
+            start_time, end_time = self._find_chunk_timestamps(chunk_words, raw_transcript, transcript_index)
             
             timestamped_chunks.append({
                 'content': chunk,
                 'chunk_index': i,
                 'start_time': start_time,
                 'end_time': end_time,
-                'word_count': len(chunk.split())
+                'word_count': len(chunk_words)
             })
         
         return timestamped_chunks
     
-    def _find_chunk_timestamps(self, chunk: str, raw_transcript: List[Dict]) -> tuple:
-        """Find start and end timestamps for a chunk"""
+    def _index_transcript(self, raw_transcript: List[Dict]) -> Tuple[str, List[int]]:
+        """Join the transcript entries into one lowercased, space-normalized string plus each entry's start offset"""
+        
+        texts = [' '.join(entry.get('text', '').lower().split()) for entry in raw_transcript]
+        offsets = []
+        offset = 0
+        for text in texts:
+            offsets.append(offset)
+            offset += len(text) + 1
+        
+        return ' '.join(texts), offsets
+    
+    def _find_chunk_timestamps(self, chunk_words: List[str], raw_transcript: List[Dict],
+                               transcript_index: Tuple[str, List[int]]) -> tuple:
+        """Find start and end timestamps for a chunk from its lowercased words"""
         
         if not raw_transcript:
             return "00:00", "00:00"
         
-        # Simple approach: find first and last words in the chunk within the transcript
-        chunk_words = chunk.split()[:5]  # Use first 5 words for matching
+        joined, offsets = transcript_index
+        
+        # Locate the chunk's first words in the joined transcript; phrases may span entries
+        chunk_start = ' '.join(chunk_words[:5])
+        start_pos = joined.find(chunk_start)
+        if start_pos == -1:
+            return "00:00", "00:00"
+        
+        start_entry = raw_transcript[bisect.bisect_right(offsets, start_pos) - 1]
+        start_time = self._format_timestamp(start_entry.get('start', 0))
         
-        start_time = None
+        # The end time comes from the entry holding the last character of the chunk's final words
         end_time = None
+        chunk_end = ' '.join(chunk_words[-5:])
+        end_pos = joined.find(chunk_end, start_pos)
+        if end_pos != -1:
+            end_entry = raw_transcript[bisect.bisect_right(offsets, end_pos + len(chunk_end) - 1) - 1]
+            end_time = self._format_timestamp(end_entry.get('start', 0) + end_entry.get('duration', 0))
         
-        # Look for the first few words of the chunk in the transcript
-        for entry in raw_transcript:
-            transcript_text = entry.get('text', '').lower()
-            chunk_start = ' '.join(chunk_words).lower()
-            
-            if chunk_start in transcript_text:
-                start_time = self._format_timestamp(entry.get('start', 0))
-                break
-        
-        # Use a similar approach for end time (simplified)
-        if start_time:
-            chunk_end_words = chunk.split()[-5:]  # Use last 5 words
-            for entry in raw_transcript:
-                transcript_text = entry.get('text', '').lower()
-                chunk_end = ' '.join(chunk_end_words).lower()
-                
-                if chunk_end in transcript_text:
-                    end_time = self._format_timestamp(entry.get('start', 0) + entry.get('duration', 0))
-                    break
-        
-        return start_time or "00:00", end_time or "00:00"
+        return start_time, end_time or "00:00"
     
     def _format_timestamp(self, seconds: float) -> str:
         """Format seconds into MM:SS or HH:MM:SS format"""
@@ -1,5 +1,6 @@
 import os
 import asyncio
+import re
 import sys
 from typing import Dict, Any
 from .base_agent import BaseAgent
@@ -12,6 +13,9 @@ try:
 except ImportError:
     YouTubeAPI = None
 
+# [Music], [Applause], etc. and parenthetical notes, removed in one scan
+_ARTIFACT_RE = re.compile(r'\[[^\]]*\]|\([^)]*\)')
+
 class TranscriptFetcher(BaseAgent):
     """Agent responsible for fetching YouTube video transcripts"""
     
@@ -103,12 +107,11 @@ class TranscriptFetcher(BaseAgent):
         full_text = " ".join([entry['text'] for entry in transcript_list])
         
         # Clean up the text
-        # Remove extra whitespace
-        full_text = re.sub(r'\s+', ' ', full_text)
+        # Remove extra whitespace; str.split runs in C without the regex engine
+        full_text = " ".join(full_text.split())
         
         # Remove common transcript artifacts
-        full_text = re.sub(r'\[.*?\]', '', full_text)  # Remove [Music], [Applause], etc.
-        full_text = re.sub(r'\(.*?\)', '', full_text)  # Remove parenthetical notes
+        full_text = _ARTIFACT_RE.sub('', full_text)
         
         # Fix common transcription issues
         full_text = full_text.replace(' .', '.')
@@ -0,0 +1,156 @@
+"""
+Small LRU + TTL caches: async results keyed by content hash, and values keyed
+by embedding similarity.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+
+def content_key(*parts: str) -> str:
+    """Hash text parts into a compact cache key; parts are NUL-separated so they can't run together"""
+
+    return hashlib.blake2b("\0".join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class AsyncTTLCache:
+    """LRU cache of awaited results that expire after ttl_seconds"""
+
+    def __init__(self, maxsize: int = 256, ttl_seconds: float = 600):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+
+        # key -> (monotonic timestamp, value); order tracks recency
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+
+        # key -> future for values currently being computed
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, awaiting compute() once on a miss"""
+
+        cached = self._entries.get(key)
+        if cached is not None:
+            if time.monotonic() - cached[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            del self._entries[key]
+
+        # Concurrent misses for the same key wait on the first caller's result
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except Exception as e:
+            # Failures are shared with waiters but never cached
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            self._entries[key] = (time.monotonic(), value)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return value
+        finally:
+            del self._inflight[key]
+            if not future.done():
+                future.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters"""
+
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class SimilarityTTLCache:
+    """LRU cache whose lookups match any stored vector within a cosine threshold"""
+
+    def __init__(self, threshold: float = 0.97, maxsize: int = 512, ttl_seconds: float = 600):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+
+        # Unit-length rows, allocated on the first put once the dimension is known
+        self._matrix: Optional[np.ndarray] = None
+        self._stamps = np.full(maxsize, -np.inf)
+
+        # row -> value for live rows; order tracks recency
+        self._values: "OrderedDict[int, Any]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, vector: np.ndarray) -> Any:
+        """Return the value stored under the most similar live vector, or None"""
+
+        if not self._values:
+            self.misses += 1
+            return None
+
+        # Expired and free rows carry -inf stamps and are masked out of the match
+        sims = self._matrix @ _unit(vector, self._matrix.dtype)
+        sims[self._stamps < time.monotonic() - self.ttl_seconds] = -np.inf
+        row = int(np.argmax(sims))
+
+        if sims[row] < self.threshold:
+            self.misses += 1
+            return None
+
+        self._values.move_to_end(row)
+        self.hits += 1
+        return self._values[row]
+
+    def put(self, vector: np.ndarray, value: Any):
+        """Store value under vector, evicting the least recently used entry when full"""
+
+        if self._matrix is None:
+            self._matrix = np.zeros((self.maxsize, len(vector)), dtype=np.float32)
+
+        if len(self._values) < self.maxsize:
+            row = len(self._values)
+        else:
+            row, _ = self._values.popitem(last=False)
+
+        self._matrix[row] = _unit(vector, self._matrix.dtype)
+        self._stamps[row] = time.monotonic()
+        self._values[row] = value
+
+    def clear(self):
+        """Drop every entry, e.g. after the data the values were computed from changed"""
+
+        self._values.clear()
+        self._stamps.fill(-np.inf)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss counters"""
+
+        return {
+            'entries': len(self._values),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def _unit(vector: np.ndarray, dtype) -> np.ndarray:
+    vector = np.asarray(vector, dtype=dtype)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
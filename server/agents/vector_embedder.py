@@ -1,9 +1,24 @@
 import os
 import asyncio
+import base64
+from collections import OrderedDict
 import numpy as np
-from typing import Dict, Any, List
+import openai
+from typing import Dict, Any, List, Optional
 import json
 from .base_agent import BaseAgent
+from .ttl_cache import content_key
+from services.quantize import quantize
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
 
 class VectorEmbedder(BaseAgent):
     """Agent responsible for creating embeddings and managing vector database"""
@@ -17,6 +32,8 @@ class VectorEmbedder(BaseAgent):
         self.vector_dimension = 1536
         self.openai_api_key = os.getenv('OPENAI_API_KEY', '')
         self.google_api_key = os.getenv('GOOGLE_API_KEY', '')
+        # One client for every embedding request, so requests reuse its pooled connections
+        self.openai_client = openai.AsyncOpenAI(api_key=self.openai_api_key) if self.openai_api_key else None
         
         # Initialize FAISS-powered vector database
         try:
@@ -27,7 +44,36 @@ class VectorEmbedder(BaseAgent):
         except ImportError:
             # Fallback to a simple dict if VectorDatabase is not available
             self.vector_db = None
-        self.embeddings_cache = {}
+        # LRU of embeddings keyed by a hash of the text, so cached chunk strings aren't kept alive
+        self.embeddings_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.embeddings_cache_size = int(os.getenv('EMBED_CACHE_SIZE', '10000'))
+        
+        # Inputs per embeddings request and requests in flight at once (the API takes up to 2048 inputs)
+        self.embed_batch_size = int(os.getenv('EMBED_BATCH_SIZE', '256'))
+        self._embed_sem = asyncio.Semaphore(int(os.getenv('EMBED_CONCURRENCY', '5')))
+        
+        # chunk_id -> chunk metadata; the chunks' unit-length embeddings live only as
+        # rows of one contiguous matrix so a search is a single matrix-vector product.
+        # QUANTIZE_EMB=1 stores the rows as int8 with a per-row scale (row ~= q * scale).
+        self.quantize = os.getenv('QUANTIZE_EMB') == '1'
+        self.vector_store: Dict[str, Dict[str, Any]] = {}
+        self._emb_matrix = np.empty((0, self.vector_dimension), dtype=np.int8 if self.quantize else np.float32)
+        self._emb_scales = np.empty(0, dtype=np.float32)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        
+        # Past IVF_MIN_VECTORS chunks, searches go through a FAISS IVF index over the same rows.
+        # IVF_FACTORY picks the layout, e.g. "IVF{nlist},PQ48x8" to store ~48 bytes per vector
+        # (quantized stores default to the int8 scalar quantizer, "IVF{nlist},SQ8");
+        # nlist is filled in as sqrt(N) and IVF_NPROBE (or a task's 'nprobe') trades recall for speed.
+        self.ivf_min_vectors = int(os.getenv('IVF_MIN_VECTORS', '10000'))
+        self.ivf_factory = os.getenv('IVF_FACTORY', 'IVF{nlist},SQ8' if self.quantize else 'IVF{nlist},Flat')
+        self.ivf_nprobe = int(os.getenv('IVF_NPROBE', '16'))
+        self._ivf_index = None
+        self._ivf_trained_on = 0
+        self._ivf_indexed = 0
+        self._ivf_stale = set()
+        self._ivf_lock = asyncio.Lock()
     
     async def process_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Process a vector embedding task"""
@@ -36,6 +82,8 @@ class VectorEmbedder(BaseAgent):
         
         if task_type == 'create_embeddings':
             return await self._create_embeddings(task)
+        elif task_type == 'create_embeddings_batch':
+            return await self._create_embeddings_batch(task)
         elif task_type == 'search_similar':
             return await self._search_similar(task)
         elif task_type == 'update_index':
@@ -57,12 +105,10 @@ class VectorEmbedder(BaseAgent):
         try:
             embedded_chunks = []
             
-            for chunk in chunks:
-                content = chunk.get('content', '')
-                
-                # Create embedding (mock implementation)
-                embedding = await self._get_embedding(content)
-                
+            # Embed every chunk up front; only uncached texts go to the API, in concurrent batches
+            embeddings = await self._get_embeddings([chunk.get('content', '') for chunk in chunks])
+            
+            for chunk, embedding in zip(chunks, embeddings):
                 chunk_with_embedding = {
                     **chunk,
                     'embedding': embedding.tolist(),
@@ -73,7 +119,7 @@ class VectorEmbedder(BaseAgent):
                 
                 # Store in vector database
                 chunk_id = f"{youtube_id}_{chunk.get('chunk_index', 0)}"
-                self.vector_store[chunk_id] = chunk_with_embedding
+                self._store_chunk(chunk_id, chunk_with_embedding, embedding)
             
             result = {
                 'youtube_id': youtube_id,
@@ -89,6 +135,29 @@ class VectorEmbedder(BaseAgent):
             self.log_action(f"Failed to create embeddings for {youtube_id}: {str(e)}", "error")
             raise
     
+    async def _create_embeddings_batch(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Create embeddings for a list of raw texts using a single API request"""
+        
+        texts = task.get('chunks', [])
+        
+        if not texts:
+            raise ValueError("Chunks are required for embedding creation")
+        
+        self.log_action(f"Creating batched embeddings for {len(texts)} texts")
+        
+        try:
+            embeddings = await self._get_embeddings(texts)
+            
+            return {
+                'embeddings': embeddings,
+                'total_embeddings': len(embeddings),
+                'vector_dimension': self.vector_dimension
+            }
+            
+        except Exception as e:
+            self.log_action(f"Failed to create batched embeddings: {str(e)}", "error")
+            raise
+    
     async def _search_similar(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """Search for similar chunks based on query embedding"""
         
@@ -104,34 +173,44 @@ class VectorEmbedder(BaseAgent):
             # Get query embedding
             query_embedding = await self._get_embedding(query)
             
-            # Calculate similarities
-            similarities = []
+            count = len(self._ids)
+            norm = np.linalg.norm(query_embedding)
+            query_unit = np.asarray(query_embedding / norm if norm else query_embedding, dtype=np.float32)
+            k = min(top_k, 3, count)  # Limit to 3 chunks max
             
-            for chunk_id, chunk_data in self.vector_store.items():
-                chunk_embedding = np.array(chunk_data.get('embedding', []))
+            # The IVF index is built by update_index; until it covers every row, scan the matrix
+            index = self._ivf_index if k > 0 and self._ivf_indexed == count and not self._ivf_stale else None
+            if index is not None:
+                # Inner product on unit vectors is cosine similarity; only nprobe lists are scanned
+                faiss.extract_index_ivf(index).nprobe = task.get('nprobe', self.ivf_nprobe)
+                scores, rows = index.search(query_unit[None, :], k)
+                candidates = [(int(row), float(score)) for row, score in zip(rows[0], scores[0]) if row >= 0]
+            else:
+                # Score every stored chunk with one matrix-vector product
+                if self.quantize:
+                    # Integer dot products on the int8 rows, rescaled to cosine afterwards
+                    query_q, query_scale = quantize(query_unit)
+                    if simsimd:
+                        dots = np.asarray(simsimd.cdist(query_q[None, :], self._emb_matrix[:count], metric="dot"))[0]
+                    else:
+                        dots = np.einsum('ij,j->i', self._emb_matrix[:count], query_q, dtype=np.int32)
+                    sims = dots * self._emb_scales[:count] * query_scale
+                else:
+                    sims = self._emb_matrix[:count] @ query_unit
                 
-                if len(chunk_embedding) == self.vector_dimension:
-                    similarity = self._cosine_similarity(query_embedding, chunk_embedding)
-                    
-                    similarities.append({
-                        'chunk_id': chunk_id,
-                        'similarity': similarity,
-                        'content': chunk_data.get('content', ''),
-                        'youtube_id': chunk_data.get('youtube_id'),
-                        'start_time': chunk_data.get('start_time'),
-                        'end_time': chunk_data.get('end_time')
-                    })
-            
-            # Filter for high relevance and sort by similarity (highest first)
-            # Note: Higher cosine similarity = smaller distance = more relevant
-            high_relevance = [s for s in similarities if s['similarity'] > 0.5]
-            high_relevance.sort(key=lambda x: x['similarity'], reverse=True)  # Highest similarity first
-            top_results = high_relevance[:min(top_k, 3)]  # Limit to 3 chunks max
+                # Select the best rows in O(N) with argpartition, then sort only those (highest first)
+                # Note: Higher cosine similarity = smaller distance = more relevant
+                top_rows = np.argpartition(-sims, k - 1)[:k] if k > 0 else np.empty(0, dtype=np.intp)
+                top_rows = top_rows[np.argsort(-sims[top_rows])]
+                candidates = [(int(row), float(sims[row])) for row in top_rows]
+            
+            # Filter for high relevance
+            top_results = [self._match(row, similarity) for row, similarity in candidates if similarity > 0.5]
             
             result = {
                 'query': query,
                 'top_matches': top_results,
-                'total_searched': len(similarities)
+                'total_searched': count
             }
             
             self.log_action(f"Found {len(top_results)} similar chunks for query")
@@ -147,12 +226,13 @@ class VectorEmbedder(BaseAgent):
         self.log_action("Updating vector index")
         
         try:
-            # In a real implementation, this would rebuild/optimize the FAISS index
+            # Train or catch up the IVF index now rather than on the next search
+            index = await self._refresh_ivf_index()
             index_stats = {
                 'total_vectors': len(self.vector_store),
                 'vector_dimension': self.vector_dimension,
-                'memory_usage': len(self.vector_store) * self.vector_dimension * 4,  # 4 bytes per float
-                'index_type': 'flat'  # Would be more sophisticated in FAISS
+                'memory_usage': len(self._ids) * self.vector_dimension * self._emb_matrix.itemsize,
+                'index_type': self.ivf_factory.format(nlist=faiss.extract_index_ivf(index).nlist) if index is not None else 'flat'
             }
             
             self.log_action(f"Vector index updated. {index_stats['total_vectors']} vectors indexed")
@@ -166,21 +246,21 @@ class VectorEmbedder(BaseAgent):
         """Get embedding for text (mock implementation)"""
         
         # Check cache first
-        if text in self.embeddings_cache:
-            return self.embeddings_cache[text]
+        key = content_key(text)
+        cached = self._cached_embedding(key)
+        if cached is not None:
+            return cached
         
         # Use OpenAI API for embeddings
         try:
-            import openai
-            api_key = os.getenv('OPENAI_API_KEY')
-            if api_key:
-                client = openai.OpenAI(api_key=api_key)
-                response = client.embeddings.create(
+            if self.openai_client:
+                response = await self.openai_client.embeddings.create(
                     model="text-embedding-ada-002",
-                    input=text
+                    input=text,
+                    encoding_format="base64"
                 )
-                embedding = np.array(response.data[0].embedding, dtype=np.float32)
-                self.embeddings_cache[text] = embedding
+                embedding = np.frombuffer(base64.b64decode(response.data[0].embedding), dtype=np.float32)
+                self._cache_put(key, embedding)
                 return embedding
         except Exception as e:
             self.log_action(f"OpenAI embedding failed: {e}", "error")
@@ -188,17 +268,165 @@ class VectorEmbedder(BaseAgent):
         # This should never happen in production
         raise Exception("OpenAI API not available - check OPENAI_API_KEY")
     
+    async def _get_embeddings(self, texts: List[str]) -> List[np.ndarray]:
+        """Get embeddings for many texts, sending the cache misses as concurrent batched requests"""
+        
+        keys = {text: content_key(text) for text in texts}
+        found = {}
+        for text, key in keys.items():
+            cached = self._cached_embedding(key)
+            if cached is not None:
+                found[text] = cached
+        missing = [text for text in keys if text not in found]
+        
+        if missing:
+            if not self.openai_client:
+                raise Exception("OpenAI API not available - check OPENAI_API_KEY")
+            
+            # Group texts of similar length so batches carry comparable token counts
+            missing.sort(key=len)
+            batches = [missing[i:i + self.embed_batch_size] for i in range(0, len(missing), self.embed_batch_size)]
+            for embedded in await asyncio.gather(*(self._embed_batch(batch) for batch in batches)):
+                found.update(embedded)
+            for text in missing:
+                self._cache_put(keys[text], found[text])
+        
+        # Answer from the local results, since the bounded cache may already have evicted some
+        return [found[text] for text in texts]
+    
+    async def _embed_batch(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """Embed one batch of texts with a single request"""
+        
+        async with self._embed_sem:
+            response = await self.openai_client.embeddings.create(
+                model=self.embedding_model,
+                input=texts,
+                encoding_format="base64"
+            )
+        
+        # Vectors arrive as base64 float32 bytes, which decode without a list round trip
+        return {
+            text: np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32)
+            for text, item in zip(texts, response.data)
+        }
+    
+    def cache_embeddings(self, embeddings: Dict[str, np.ndarray]):
+        """Seed the embedding cache with precomputed text -> embedding pairs"""
+        
+        for text, embedding in embeddings.items():
+            self._cache_put(content_key(text), embedding)
+    
+    def _cached_embedding(self, key: str) -> Optional[np.ndarray]:
+        embedding = self.embeddings_cache.get(key)
+        if embedding is not None:
+            self.embeddings_cache.move_to_end(key)
+        return embedding
+    
+    def _cache_put(self, key: str, embedding: np.ndarray):
+        self.embeddings_cache[key] = embedding
+        self.embeddings_cache.move_to_end(key)
+        while len(self.embeddings_cache) > self.embeddings_cache_size:
+            self.embeddings_cache.popitem(last=False)
+    
+    def _store_chunk(self, chunk_id: str, chunk: Dict[str, Any], embedding: np.ndarray):
+        """Store a chunk's metadata and write its normalized embedding into the search matrix"""
+        
+        self.vector_store[chunk_id] = {key: value for key, value in chunk.items() if key != 'embedding'}
+        
+        if len(embedding) != self.vector_dimension:
+            return
+        
+        row = self._rows.get(chunk_id)
+        if row is None:
+            row = len(self._ids)
+            if row == len(self._emb_matrix):
+                # Grow geometrically so appends stay amortized O(1)
+                capacity = max(2 * row, 64)
+                self._emb_matrix = np.resize(self._emb_matrix, (capacity, self.vector_dimension))
+                self._emb_scales = np.resize(self._emb_scales, capacity)
+            self._ids.append(chunk_id)
+            self._rows[chunk_id] = row
+        else:
+            # Rewritten rows are re-added to the IVF index on its next refresh
+            self._ivf_stale.add(row)
+        
+        norm = np.linalg.norm(embedding)
+        unit = np.asarray(embedding / norm if norm else embedding * 0.0, dtype=np.float32)
+        if self.quantize:
+            self._emb_matrix[row], self._emb_scales[row] = quantize(unit)
+        else:
+            self._emb_matrix[row], self._emb_scales[row] = unit, 1.0
+    
+    def _row_vectors(self, rows) -> np.ndarray:
+        """Float32 copies of matrix rows, dequantized when the matrix is int8"""
+        
+        if self.quantize:
+            return self._emb_matrix[rows] * self._emb_scales[rows, None]
+        return self._emb_matrix[rows]
+    
+    async def _refresh_ivf_index(self):
+        """Train or catch up the FAISS IVF index over all matrix rows, or return None while a flat scan is cheaper"""
+        
+        async with self._ivf_lock:
+            count = len(self._ids)
+            if faiss is None or count < self.ivf_min_vectors:
+                return None
+            
+            # Retrain whenever the corpus has doubled so nlist keeps tracking sqrt(N).
+            # Training runs in a worker thread; rows rewritten meanwhile stay in _ivf_stale.
+            if self._ivf_index is None or count >= 2 * self._ivf_trained_on:
+                self._ivf_stale.clear()
+                index = await asyncio.to_thread(self._build_ivf_index, self._row_vectors(slice(0, count)))
+                self._ivf_index = index
+                self._ivf_trained_on = count
+                self._ivf_indexed = count
+            
+            # Re-add rows whose embedding changed after they were indexed, then append new rows
+            stale = np.fromiter((row for row in self._ivf_stale if row < self._ivf_indexed), dtype=np.int64)
+            self._ivf_stale.clear()
+            if len(stale):
+                self._ivf_index.remove_ids(stale)
+                self._ivf_index.add_with_ids(self._row_vectors(stale), stale)
+            count = len(self._ids)
+            if self._ivf_indexed < count:
+                self._ivf_index.add_with_ids(self._row_vectors(slice(self._ivf_indexed, count)), np.arange(self._ivf_indexed, count, dtype=np.int64))
+                self._ivf_indexed = count
+            
+            return self._ivf_index
+    
+    def _build_ivf_index(self, vectors: np.ndarray):
+        """Train a new IVF index on vectors and add them with their row numbers as ids"""
+        
+        nlist = max(1, int(np.sqrt(len(vectors))))
+        index = faiss.index_factory(self.vector_dimension, self.ivf_factory.format(nlist=nlist), faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+        return index
+    
+    def _match(self, row: int, similarity: float) -> Dict[str, Any]:
+        """Build the search result for the chunk stored at a matrix row"""
+        
+        chunk_id = self._ids[row]
+        chunk_data = self.vector_store[chunk_id]
+        return {
+            'chunk_id': chunk_id,
+            'similarity': similarity,
+            'content': chunk_data.get('content', ''),
+            'youtube_id': chunk_data.get('youtube_id'),
+            'start_time': chunk_data.get('start_time'),
+            'end_time': chunk_data.get('end_time')
+        }
+    
     def _cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
         """Calculate cosine similarity between two vectors"""
         
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
+        # One sqrt over the product of squared norms instead of two norm() calls
+        squared_norms = np.vdot(vec1, vec1) * np.vdot(vec2, vec2)
         
-        if norm1 == 0 or norm2 == 0:
+        if squared_norms == 0:
             return 0.0
         
-        return dot_product / (norm1 * norm2)
+        return np.dot(vec1, vec2) / np.sqrt(squared_norms)
     
     def get_vector_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector database"""
@@ -206,6 +434,6 @@ class VectorEmbedder(BaseAgent):
         return {
             'total_vectors': len(self.vector_store),
             'vector_dimension': self.vector_dimension,
-            'memory_usage_mb': (len(self.vector_store) * self.vector_dimension * 4) / (1024 * 1024),
+            'memory_usage_mb': (len(self._ids) * self.vector_dimension * self._emb_matrix.itemsize) / (1024 * 1024),
             'unique_videos': len(set(chunk.get('youtube_id', '') for chunk in self.vector_store.values()))
         }
@@ -10,8 +10,14 @@ import sys
 from typing import Dict, Any, List
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 import uvicorn
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Set up environment
 os.environ.setdefault('PYTHONPATH', os.path.dirname(__file__))
 
@@ -24,8 +30,13 @@ sys.path.insert(0, agents_dir)
 sys.path.insert(0, services_dir)
 
 from agents.orchestrator import AgentOrchestrator
+from agents.llm_cache import get_cached_llm, LLM_CACHE_PATH
 
-app = FastAPI(title="YouTube AI Agent System - Python Backend")
+# Responses carry full transcripts and per-chunk embeddings, so serialize them with orjson when available
+app = FastAPI(
+    title="YouTube AI Agent System - Python Backend",
+    default_response_class=ORJSONResponse if orjson else JSONResponse
+)
 
 # Configure CORS
 app.add_middleware(
@@ -44,6 +55,17 @@ async def startup_event():
     """Initialize agents on startup"""
     print("Starting Python agent orchestrator...")
     print(f"Available agents: {[agent.name for agent in [orchestrator.transcript_fetcher, orchestrator.text_chunker, orchestrator.vector_embedder, orchestrator.query_processor]]}")
+    # Warming the LLM cache costs API calls, so it only runs when asked for;
+    # it runs in the background so startup is not blocked on the API
+    if os.environ.get("LLM_WARMUP") == "1":
+        app.state.warmup_task = asyncio.create_task(orchestrator.warmup())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Persist the LLM cache so the next start keeps its hits"""
+    cache = get_cached_llm()
+    cache.save(LLM_CACHE_PATH)
+    await cache.aclose()
 
 @app.get("/health")
 async def health_check():
@@ -34,10 +34,10 @@ def load_vector_db() -> VectorDatabase:
     persistence_base = data_dir / "vector_store"
     vdb = VectorDatabase()
     vdb.load_from_file(str(persistence_base))
-    if not vdb.vectors:
+    if not len(vdb):
         print("[warn] Loaded vector DB contains 0 vectors – did you persist after indexing?", file=sys.stderr)
     else:
-        print(f"Loaded {len(vdb.vectors):,} vectors from {persistence_base}")
+        print(f"Loaded {len(vdb):,} vectors from {persistence_base}")
     return vdb
 
 
@@ -72,7 +72,7 @@ def main():
             for row in rows:
                 chunk_id, youtube_id, chunk_index = row
                 vec_key = f"{youtube_id}_{chunk_index}"
-                vec = vector_db.vectors.get(vec_key)
+                vec = vector_db.get_vector(vec_key)
                 if vec is None:
                     # fallback: maybe int index without leading zeros? skip for now
                     continue
@@ -0,0 +1,14 @@
+"""
+Symmetric int8 quantization shared by the in-memory embedding stores.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+
+def quantize(vector: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Quantize a vector to int8 with a single scale so that vector ~= q * scale"""
+
+    scale = max(float(np.abs(vector).max()), 1e-12) / 127
+    return np.round(vector / scale).astype(np.int8), scale
@@ -1,18 +1,62 @@
+import bisect
 import numpy as np
 import faiss
-from typing import Dict, Any, List, Optional
+from collections.abc import Mapping
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 import json
 import os
 import pickle
 
+from .quantize import quantize
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
 class VectorDatabase:
     """Simple in-memory vector database (would use FAISS in production)"""
     
-    def __init__(self, dimension: int = 1536):
+    def __init__(self, dimension: int = 1536, quantize: Optional[bool] = None):
         self.dimension = dimension
-        self.vectors = {}
+        # int8 rows with a per-row scale use a quarter of the memory; QUANTIZE_EMB=1 turns it on
+        self.quantize = os.getenv('QUANTIZE_EMB') == '1' if quantize is None else quantize
         self.metadata = {}
         self.index_dirty = False
+        # Bumped on every add/remove so callers can tell when cached search results are stale
+        self.version = 0
+        self._reset_storage()
+    
+    def _reset_storage(self, capacity: int = 0):
+        # Vectors live in one contiguous matrix so a search is a single
+        # matrix-vector product; ids[i] names row i, rows maps ids back to rows.
+        # Row i holds vector i / scales[i] (scales are 1 unless quantized)
+        self._matrix = np.empty((capacity, self.dimension), dtype=np.int8 if self.quantize else np.float32)
+        self._scales = np.empty(capacity, dtype=np.float32)
+        self._inv_norms = np.empty(capacity, dtype=np.float32)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        # Lowercased chunk content per row, so keyword search never re-lowercases
+        self._contents_lower: List[str] = []
+        self._text_index: Optional[Tuple[str, List[int]]] = None
+    
+    @property
+    def vectors(self) -> Mapping[str, np.ndarray]:
+        """Read-only id -> vector mapping over the matrix; rows are dequantized only when looked up"""
+        
+        return _VectorsView(self)
+    
+    def get_vector(self, vector_id: str) -> Optional[np.ndarray]:
+        """Return one stored vector by id (dequantized when quantized), or None"""
+        
+        row = self._rows.get(vector_id)
+        return None if row is None else self._vector(row)
+    
+    def __len__(self) -> int:
+        return len(self._ids)
+    
+    def _vector(self, row: int) -> np.ndarray:
+        return self._matrix[row] * self._scales[row] if self.quantize else self._matrix[row]
         
     def add_vector(self, vector_id: str, vector: np.ndarray, metadata: Dict[str, Any]):
         """Add a vector to the database"""
@@ -20,9 +64,31 @@ class VectorDatabase:
         if len(vector) != self.dimension:
             raise ValueError(f"Vector dimension {len(vector)} does not match database dimension {self.dimension}")
         
-        self.vectors[vector_id] = vector.copy()
+        row = self._rows.get(vector_id)
+        if row is None:
+            row = len(self._ids)
+            if row == len(self._matrix):
+                # Grow geometrically so appends stay amortized O(d)
+                capacity = max(2 * row, 64)
+                self._matrix = np.resize(self._matrix, (capacity, self.dimension))
+                self._scales = np.resize(self._scales, capacity)
+                self._inv_norms = np.resize(self._inv_norms, capacity)
+            self._ids.append(vector_id)
+            self._contents_lower.append("")
+            self._rows[vector_id] = row
+        
+        vector = np.asarray(vector, dtype=np.float32)
+        squared_norm = np.vdot(vector, vector)
+        self._inv_norms[row] = 1 / np.sqrt(squared_norm) if squared_norm else 0.0
+        if self.quantize:
+            self._matrix[row], self._scales[row] = quantize(vector)
+        else:
+            self._matrix[row], self._scales[row] = vector, 1.0
+        self._contents_lower[row] = metadata.get('content', '').lower()
+        self._text_index = None
         self.metadata[vector_id] = metadata.copy()
         self.index_dirty = True
+        self.version += 1
     
     def search_similar(self, query_vector: np.ndarray, top_k: int = 10, threshold: float = 0.0) -> List[Dict[str, Any]]:
         """Search for similar vectors"""
@@ -30,33 +96,90 @@ class VectorDatabase:
         if len(query_vector) != self.dimension:
             raise ValueError(f"Query vector dimension {len(query_vector)} does not match database dimension {self.dimension}")
         
-        if not self.vectors:
+        count = len(self._ids)
+        if not count or top_k <= 0:
             return []
         
-        # Calculate similarities
-        similarities = []
+        # Cosine similarity against every stored vector in one pass; zero vectors score 0
+        query = np.asarray(query_vector, dtype=np.float32)
+        squared_norm = np.vdot(query, query)
+        inv_query_norm = 1 / np.sqrt(squared_norm) if squared_norm else 0.0
+        if self.quantize:
+            # Integer dot products against the int8 rows, rescaled afterwards
+            query, query_scale = quantize(query)
+            if simsimd:
+                dots = np.asarray(simsimd.cdist(query[None, :], self._matrix[:count], metric="dot"))[0]
+            else:
+                dots = np.einsum('ij,j->i', self._matrix[:count], query, dtype=np.int32)
+            sims = dots * (self._scales[:count] * self._inv_norms[:count]) * (query_scale * inv_query_norm)
+        else:
+            sims = (self._matrix[:count] @ query) * self._inv_norms[:count] * inv_query_norm
         
-        for vector_id, vector in self.vectors.items():
-            similarity = self._cosine_similarity(query_vector, vector)
-            
-            if similarity >= threshold:
-                result = {
-                    'id': vector_id,
-                    'similarity': float(similarity),
-                    'metadata': self.metadata.get(vector_id, {})
-                }
-                similarities.append(result)
+        # Select the top k above the threshold without sorting every candidate
+        candidates = np.flatnonzero(sims >= threshold)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-sims[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-sims[candidates], kind='stable')]
         
-        # Sort by similarity (descending) and return top k
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        return similarities[:top_k]
+        return [
+            {
+                'id': self._ids[row],
+                'similarity': float(sims[row]),
+                'metadata': self.metadata.get(self._ids[row], {})
+            }
+            for row in candidates
+        ]
+    
+    def search_text(self, text: str) -> List[str]:
+        """Ids of vectors whose content contains text, ignoring case"""
+        
+        text = text.lower()
+        if not self._ids or "\0" in text:
+            return []
+        
+        # All contents NUL-joined into one string with each row's start offset,
+        # rebuilt lazily after the rows change
+        if self._text_index is None:
+            starts, offset = [], 0
+            for content in self._contents_lower:
+                starts.append(offset)
+                offset += len(content) + 1
+            self._text_index = ("\0".join(self._contents_lower), starts)
+        blob, starts = self._text_index
+        
+        # str.find scans the whole corpus in C; Python only runs once per matching row
+        matches = []
+        pos = blob.find(text)
+        while pos != -1:
+            row = bisect.bisect_right(starts, pos) - 1
+            matches.append(self._ids[row])
+            if row + 1 == len(starts):
+                break
+            pos = blob.find(text, starts[row + 1])
+        return matches
     
     def remove_vector(self, vector_id: str):
         """Remove a vector from the database"""
         
-        self.vectors.pop(vector_id, None)
+        row = self._rows.pop(vector_id, None)
+        if row is not None:
+            # Move the last row into the gap so rows stay contiguous
+            last = len(self._ids) - 1
+            if row != last:
+                moved_id = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._scales[row] = self._scales[last]
+                self._inv_norms[row] = self._inv_norms[last]
+                self._ids[row] = moved_id
+                self._contents_lower[row] = self._contents_lower[last]
+                self._rows[moved_id] = row
+            self._ids.pop()
+            self._contents_lower.pop()
+            self._text_index = None
+        
         self.metadata.pop(vector_id, None)
         self.index_dirty = True
+        self.version += 1
     
     def remove_by_metadata(self, key: str, value: Any):
         """Remove vectors by metadata criteria"""
@@ -74,7 +197,7 @@ class VectorDatabase:
         """Get database statistics"""
         
         return {
-            'total_vectors': len(self.vectors),
+            'total_vectors': len(self._ids),
             'dimension': self.dimension,
             'memory_usage_mb': self._estimate_memory_usage(),
             'index_dirty': self.index_dirty
@@ -83,16 +206,17 @@ class VectorDatabase:
     def clear(self):
         """Clear the entire database"""
         
-        self.vectors.clear()
+        self._reset_storage()
         self.metadata.clear()
         self.index_dirty = False
+        self.version += 1
     
     def save_to_file(self, filepath: str):
         """Save database to file"""
         
         data = {
             'dimension': self.dimension,
-            'vectors': {k: v.tolist() for k, v in self.vectors.items()},
+            'vectors': {vector_id: self._vector(row).tolist() for vector_id, row in self._rows.items()},
             'metadata': self.metadata
         }
         
@@ -109,29 +233,38 @@ class VectorDatabase:
             data = json.load(f)
         
         self.dimension = data['dimension']
-        self.vectors = {k: np.array(v) for k, v in data['vectors'].items()}
+        self._reset_storage(len(data['vectors']))
+        for vector_id, vector in data['vectors'].items():
+            self.add_vector(vector_id, np.array(vector, dtype=np.float32), data['metadata'].get(vector_id, {}))
         self.metadata = data['metadata']
         self.index_dirty = False
-    
-    def _cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
-        """Calculate cosine similarity between two vectors"""
-        
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
-        
-        if norm1 == 0 or norm2 == 0:
-            return 0.0
-        
-        return dot_product / (norm1 * norm2)
+        self.version += 1
     
     def _estimate_memory_usage(self) -> float:
         """Estimate memory usage in MB"""
         
-        vector_memory = len(self.vectors) * self.dimension * 8  # 8 bytes per float64
+        vector_memory = len(self._ids) * self.dimension * self._matrix.itemsize
         metadata_memory = sum(len(str(m)) for m in self.metadata.values()) * 2  # Rough estimate
         
         return (vector_memory + metadata_memory) / (1024 * 1024)
 
+class _VectorsView(Mapping):
+    """Lazy Mapping over a VectorDatabase's rows, so len() and lookups never copy the whole matrix"""
+    
+    def __init__(self, db: VectorDatabase):
+        self._db = db
+    
+    def __getitem__(self, vector_id: str) -> np.ndarray:
+        vector = self._db.get_vector(vector_id)
+        if vector is None:
+            raise KeyError(vector_id)
+        return vector
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._db._ids))
+    
+    def __len__(self) -> int:
+        return len(self._db)
+
 # Global vector database instance
 vector_db = VectorDatabase()
@@ -2,11 +2,35 @@
 YouTube Data API v3 integration for reliable video data retrieval
 """
 import os
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, List, Optional, Any
 import xml.etree.ElementTree as ET
 from urllib.parse import parse_qs, urlparse
 
+# URL patterns tried in order by the extract helpers
+_VIDEO_ID_RES = [
+    re.compile(r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([a-zA-Z0-9_-]{11})'),
+    re.compile(r'^[a-zA-Z0-9_-]{11}$')
+]
+_CHANNEL_RES = [
+    re.compile(r'youtube\.com/channel/([a-zA-Z0-9_-]+)'),
+    re.compile(r'youtube\.com/c/([a-zA-Z0-9_-]+)'),
+    re.compile(r'youtube\.com/user/([a-zA-Z0-9_-]+)'),
+    re.compile(r'youtube\.com/@([a-zA-Z0-9_-]+)')
+]
+_PLAYLIST_RES = [
+    re.compile(r'[?&]list=([a-zA-Z0-9_-]+)'),  # Standard playlist parameter
+    re.compile(r'/playlist\?list=([a-zA-Z0-9_-]+)'),  # Direct playlist URL
+]
+
+# Caption and duration patterns used by the parse helpers
+_DURATION_RE = re.compile(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?')
+_SRT_BLOCK_SEPARATOR_RE = re.compile(r'\n\s*\n')
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
 class YouTubeAPI:
     """YouTube Data API v3 client for fetching video metadata and captions"""
     
@@ -14,16 +38,19 @@ class YouTubeAPI:
         self.api_key = os.getenv('YOUTUBE_API_KEY')
         self.base_url = 'https://www.googleapis.com/youtube/v3'
         
+        # One pooled session for every request, so calls reuse kept-alive TLS connections;
+        # transient gateway errors are retried with a short backoff
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        ))
+
     def extract_video_id(self, url: str) -> Optional[str]:
         """Extract video ID from various YouTube URL formats"""
-        patterns = [
-            r'(?:youtube\.com\/watch\?v=|youtu\.be\/|youtube\.com\/embed\/)([a-zA-Z0-9_-]{11})',
-            r'^[a-zA-Z0-9_-]{11}$'
-        ]
-        
-        import re
-        for pattern in patterns:
-            match = re.search(pattern, url)
+        for pattern in _VIDEO_ID_RES:
+            match = pattern.search(url)
             if match:
                 return match.group(1) if len(match.groups()) > 0 else match.group(0)
         return None
@@ -41,7 +68,7 @@ class YouTubeAPI:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
             
@@ -82,7 +109,7 @@ class YouTubeAPI:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
             
@@ -109,7 +136,7 @@ class YouTubeAPI:
                 'tfmt': 'srt'  # SubRip format
             }
             
-            caption_response = requests.get(download_url, params=download_params, timeout=10)
+            caption_response = self.session.get(download_url, params=download_params, timeout=10)
             caption_response.raise_for_status()
             
             # Parse SRT format to extract text and timestamps
@@ -121,11 +148,9 @@ class YouTubeAPI:
     
     def _parse_duration(self, duration_str: str) -> str:
         """Parse ISO 8601 duration to readable format"""
-        import re
         
         # Pattern for PT#H#M#S format
-        pattern = r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?'
-        match = re.match(pattern, duration_str)
+        match = _DURATION_RE.match(duration_str)
         
         if not match:
             return "0:00"
@@ -141,21 +166,20 @@ class YouTubeAPI:
     
     def _parse_srt_captions(self, srt_content: str) -> Dict[str, Any]:
         """Parse SRT caption format to extract text and timestamps"""
-        import re
         
         # Split into subtitle blocks
-        blocks = re.split(r'\n\s*\n', srt_content.strip())
+        blocks = _SRT_BLOCK_SEPARATOR_RE.split(srt_content.strip())
         
         transcript = []
-        full_text = ""
         
         for block in blocks:
-            lines = block.strip().split('\n')
-            if len(lines) < 3:
+            # Peel off the index and timestamp lines; whatever remains is the caption text
+            _, _, rest = block.strip().partition('\n')
+            timestamp_line, _, text = rest.partition('\n')
+            if not text:
                 continue
                 
             # Parse timestamp line (format: 00:00:01,000 --> 00:00:03,000)
-            timestamp_line = lines[1]
             times = timestamp_line.split(' --> ')
             if len(times) != 2:
                 continue
@@ -163,32 +187,31 @@ class YouTubeAPI:
             start_time = self._srt_time_to_seconds(times[0])
             end_time = self._srt_time_to_seconds(times[1])
             
-            # Extract text (everything after timestamp)
-            text = ' '.join(lines[2:]).strip()
-            # Remove HTML tags if present
-            text = re.sub(r'<[^>]+>', '', text)
+            # Join multi-line text and remove HTML tags if present
+            text = text.replace('\n', ' ')
+            if '<' in text:
+                text = _HTML_TAG_RE.sub('', text)
+            text = text.strip()
             
             transcript.append({
                 'start': start_time,
                 'duration': end_time - start_time,
                 'text': text
             })
-            
-            full_text += text + " "
         
         return {
             'transcript': transcript,
-            'full_text': full_text.strip()
+            'full_text': ' '.join(entry['text'] for entry in transcript).strip()
         }
     
     def _srt_time_to_seconds(self, time_str: str) -> float:
         """Convert SRT timestamp to seconds"""
         # Format: 00:01:23,456
-        time_part, ms_part = time_str.split(',')
-        hours, minutes, seconds = map(int, time_part.split(':'))
-        milliseconds = int(ms_part)
+        time_part, _, ms_part = time_str.partition(',')
+        hours, _, rest = time_part.partition(':')
+        minutes, _, seconds = rest.partition(':')
         
-        return hours * 3600 + minutes * 60 + seconds + milliseconds / 1000.0
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(ms_part) / 1000.0
 
     async def get_channel_videos(self, channel_url: str, max_results: int = 50) -> List[Dict[str, Any]]:
         """Get videos from a YouTube channel"""
@@ -209,7 +232,7 @@ class YouTubeAPI:
         }
         
         try:
-            response = requests.get(channel_url, params=channel_params, timeout=10)
+            response = self.session.get(channel_url, params=channel_params, timeout=10)
             response.raise_for_status()
             data = response.json()
             
@@ -234,7 +257,7 @@ class YouTubeAPI:
                 if next_page_token:
                     playlist_params['pageToken'] = next_page_token
                 
-                response = requests.get(playlist_url, params=playlist_params, timeout=10)
+                response = self.session.get(playlist_url, params=playlist_params, timeout=10)
                 response.raise_for_status()
                 data = response.json()
                 
@@ -261,18 +284,9 @@ class YouTubeAPI:
     
     def _extract_channel_id(self, url: str) -> Optional[str]:
         """Extract channel ID from various YouTube channel URL formats"""
-        import re
-        
         # Handle different channel URL formats
-        patterns = [
-            r'youtube\.com/channel/([a-zA-Z0-9_-]+)',
-            r'youtube\.com/c/([a-zA-Z0-9_-]+)',
-            r'youtube\.com/user/([a-zA-Z0-9_-]+)',
-            r'youtube\.com/@([a-zA-Z0-9_-]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
+        for pattern in _CHANNEL_RES:
+            match = pattern.search(url)
             if match:
                 identifier = match.group(1)
                 
@@ -305,7 +319,7 @@ class YouTubeAPI:
                     'part': 'id'
                 }
                 
-                response = requests.get(url, params=params, timeout=10)
+                response = self.session.get(url, params=params, timeout=10)
                 if response.status_code == 200:
                     data = response.json()
                     if data.get('items'):
@@ -381,16 +395,9 @@ class YouTubeAPI:
 
     def _extract_playlist_id(self, url: str) -> Optional[str]:
         """Extract playlist ID from various YouTube playlist URL formats"""
-        import re
-        
         # Various playlist URL patterns
-        patterns = [
-            r'[?&]list=([a-zA-Z0-9_-]+)',  # Standard playlist parameter
-            r'/playlist\?list=([a-zA-Z0-9_-]+)',  # Direct playlist URL
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
+        for pattern in _PLAYLIST_RES:
+            match = pattern.search(url)
             if match:
                 playlist_id = match.group(1)
                 # Validate playlist ID format
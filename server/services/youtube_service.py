@@ -3,24 +3,30 @@ import re
 from typing import Dict, Any, Optional
 import asyncio
 
+# URL patterns tried in order by extract_video_id
+_VIDEO_ID_RES = [
+    re.compile(r'(?:youtube\.com\/watch\?v=|youtu\.be\/)([^&\n?#]+)'),
+    re.compile(r'youtube\.com\/embed\/([^&\n?#]+)'),
+    re.compile(r'youtube\.com\/v\/([^&\n?#]+)'),
+    re.compile(r'youtube\.com\/.*[?&]v=([^&\n?#]+)')
+]
+
+# ISO 8601 duration components used by format_duration
+_HOURS_RE = re.compile(r'(\d+)H')
+_MINUTES_RE = re.compile(r'(\d+)M')
+_SECONDS_RE = re.compile(r'(\d+)S')
+
 class YouTubeService:
     """Service for YouTube-related operations"""
     
     def __init__(self):
         self.api_key = os.getenv('YOUTUBE_API_KEY', '')
-    
+
     def extract_video_id(self, url: str) -> Optional[str]:
         """Extract YouTube video ID from URL"""
         
-        patterns = [
-            r'(?:youtube\.com\/watch\?v=|youtu\.be\/)([^&\n?#]+)',
-            r'youtube\.com\/embed\/([^&\n?#]+)',
-            r'youtube\.com\/v\/([^&\n?#]+)',
-            r'youtube\.com\/.*[?&]v=([^&\n?#]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
+        for pattern in _VIDEO_ID_RES:
+            match = pattern.search(url)
             if match:
                 return match.group(1)
         
@@ -59,15 +65,13 @@ class YouTubeService:
         """Format YouTube duration string to readable format"""
         
         # YouTube API returns duration in ISO 8601 format (PT#M#S)
-        import re
-        
         if not duration_string or not duration_string.startswith('PT'):
             return "00:00"
         
         # Extract hours, minutes, seconds
-        hours_match = re.search(r'(\d+)H', duration_string)
-        minutes_match = re.search(r'(\d+)M', duration_string)
-        seconds_match = re.search(r'(\d+)S', duration_string)
+        hours_match = _HOURS_RE.search(duration_string)
+        minutes_match = _MINUTES_RE.search(duration_string)
+        seconds_match = _SECONDS_RE.search(duration_string)
         
         hours = int(hours_match.group(1)) if hours_match else 0
         minutes = int(minutes_match.group(1)) if minutes_match else 0